@@ -13,15 +13,41 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
+import os
 import torch
-from typing import Tuple
+import numpy as np
+from threading import Thread
+from typing import Any, Dict, Iterator, List, Tuple, Union
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    LogitsProcessorList,
+    StoppingCriteriaList,
+)
 
 from sparktts.utils.file import load_config
+from sparktts.utils.cache import DiskCache, LRUCache, hash_bytes
+from sparktts.utils.audio import crossfade, crossfade_stream
+from sparktts.utils.text import split_text
+from sparktts.utils.voice_library import VoiceLibrary
+from sparktts.utils.generation import (
+    CancelStoppingCriteria,
+    RepetitionStoppingCriteria,
+    SparkTTSLogitsProcessor,
+    TokenIdStreamer,
+    estimate_max_new_tokens,
+    seeded_rng,
+)
+from sparktts.utils.quantization import check_quantize_mode, quantize_llm_dynamic
 from sparktts.models.audio_tokenizer import BiCodecTokenizer
-from sparktts.utils.token_parser import LEVELS_MAP, GENDER_MAP, TASK_TOKEN_MAP
+from sparktts.utils.token_parser import (
+    LEVELS_MAP,
+    GENDER_MAP,
+    PromptIdBuilder,
+    GeneratedTokenParser,
+    pad_left,
+)
 
 
 class SparkTTS:
@@ -29,33 +55,200 @@ class SparkTTS:
     Spark-TTS for text-to-speech generation.
     """
 
-    def __init__(self, model_dir: Path, device: torch.device = torch.device("cuda:0")):
+    def __init__(
+        self,
+        model_dir: Path,
+        device: torch.device = torch.device("cuda:0"),
+        prompt_cache_size: int = 16,
+        prompt_cache_dir: Path = None,
+        decode_only: bool = False,
+        dtype: torch.dtype = None,
+        quantize: str = None,
+        compile_decoder: bool = False,
+        compile_cache_dir: Path = None,
+        onnx_decoder_path: Path = None,
+        result_cache_size: int = 0,
+        result_cache_dir: Path = None,
+        result_cache_max_bytes: int = None,
+        voice_library_path: Path = None,
+        decode_window: int = None,
+    ):
         """
         Initializes the SparkTTS model with the provided configurations and device.
 
         Args:
             model_dir (Path): Directory containing the model and config files.
             device (torch.device): The device (CPU/GPU) to run the model on.
+            prompt_cache_size (int): Number of tokenized prompt audios kept in memory.
+            prompt_cache_dir (Path, optional): Directory that persists tokenized prompt
+                audios across restarts.
+            decode_only (bool): Voice creation only deployment. The audio tokenizer
+                skips wav2vec2 and the BiCodec encoder parts, so voice cloning is
+                unavailable.
+            dtype (torch.dtype, optional): Compute dtype of the LLM, wav2vec2 and BiCodec,
+                e.g. torch.bfloat16. Default is fp32. The BiCodec quantizers always
+                run in fp32.
+            quantize (str, optional): "int8-dynamic" quantizes the LLM projections and
+                the BiCodec prenet Linears after loading, for CPU inference.
+            compile_decoder (bool): Run the BiCodec decoder as TorchScript graphs
+                traced per semantic length bucket.
+            compile_cache_dir (Path, optional): Directory that persists the traced
+                graphs across restarts.
+            onnx_decoder_path (Path, optional): Run the BiCodec decoder with ONNX
+                Runtime from a graph exported by `cli/export_onnx.py`.
+            result_cache_size (int): Number of seeded `inference` results kept in memory.
+            result_cache_dir (Path, optional): Directory that persists seeded
+                `inference` results across restarts.
+            result_cache_max_bytes (int, optional): Size bound of `result_cache_dir`;
+                the least recently used results are evicted beyond it.
+            voice_library_path (Path, optional): Voice library built by
+                `cli/build_voice_library.py`, whose voices are selected by `voice_id`
+                without loading or tokenizing audio, also with `decode_only`.
+            decode_window (int, optional): Decode longer semantic sequences in
+                windows of this many tokens, so that the BiCodec decoder memory
+                does not grow with the utterance length.
         """
         self.device = device
         self.model_dir = model_dir
+        self.prompt_cache_size = prompt_cache_size
+        self.prompt_cache_dir = prompt_cache_dir
+        self.decode_only = decode_only
+        self.dtype = dtype
+        self.quantize = quantize
+        self.compile_decoder = compile_decoder
+        self.compile_cache_dir = compile_cache_dir
+        self.onnx_decoder_path = onnx_decoder_path
+        self.decode_window = decode_window
+        self.voice_library = (
+            VoiceLibrary(voice_library_path) if voice_library_path is not None else None
+        )
+        check_quantize_mode(quantize, dtype, device)
         self.configs = load_config(f"{model_dir}/config.yaml")
         self.sample_rate = self.configs["sample_rate"]
         self._initialize_inference()
 
+        self.result_cache = LRUCache(
+            result_cache_size,
+            (
+                DiskCache(result_cache_dir, result_cache_max_bytes)
+                if result_cache_dir is not None
+                else None
+            ),
+        )
+        self._result_cache_salt = self._get_result_cache_salt()
+
     def _initialize_inference(self):
         """Initializes the tokenizer, model, and audio tokenizer for inference."""
         self.tokenizer = AutoTokenizer.from_pretrained(f"{self.model_dir}/LLM")
-        self.model = AutoModelForCausalLM.from_pretrained(f"{self.model_dir}/LLM")
-        self.audio_tokenizer = BiCodecTokenizer(self.model_dir, device=self.device)
+        self.prompt_builder = PromptIdBuilder(self.tokenizer)
+        self.token_parser = GeneratedTokenParser(
+            self.prompt_builder.semantic_ids,
+            self.prompt_builder.global_ids,
+            len(self.tokenizer),
+        )
+        self.model = AutoModelForCausalLM.from_pretrained(
+            f"{self.model_dir}/LLM", torch_dtype=self.dtype
+        )
+        self.audio_tokenizer = BiCodecTokenizer(
+            self.model_dir,
+            device=self.device,
+            prompt_cache_size=self.prompt_cache_size,
+            prompt_cache_dir=self.prompt_cache_dir,
+            decode_only=self.decode_only,
+            dtype=self.dtype,
+            quantize=self.quantize,
+            compile_decoder=self.compile_decoder,
+            compile_cache_dir=self.compile_cache_dir,
+            onnx_decoder_path=self.onnx_decoder_path,
+            decode_window=self.decode_window,
+        )
         self.model.to(self.device)
+        if self.quantize is not None:
+            quantize_llm_dynamic(self.model)
+
+    def _get_result_cache_salt(self) -> bytes:
+        """Identify the checkpoints and load options that generated audio depends on."""
+        salt = []
+        for name in sorted(os.listdir(f"{self.model_dir}/LLM")):
+            if name.endswith((".safetensors", ".bin", ".json")):
+                stat = os.stat(f"{self.model_dir}/LLM/{name}")
+                salt.append((name, stat.st_size, stat.st_mtime_ns))
+        # The BiCodec checkpoint and dtype are covered by the prompt cache salt
+        salt += [
+            self.quantize,
+            self.audio_tokenizer._prompt_cache_salt,
+            self.audio_tokenizer.audio_loader.resample_quality,
+        ]
+        return repr(salt).encode()
+
+    def _result_cache_key(
+        self,
+        text: str,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        voice_id: str = None,
+        *generation_args: Any,
+    ) -> str:
+        """Key of a seeded result, derived from the request so that a hit skips
+        tokenizing the prompt audio: the file contents stand for its voice tokens."""
+        if gender is not None:
+            voice = [repr((gender, pitch, speed)).encode()]
+        elif voice_id is not None:
+            global_token_ids, semantic_token_ids, prompt_text = self.prompt_voice(
+                None, prompt_text, voice_id
+            )
+            voice = [
+                global_token_ids.cpu().numpy().tobytes(),
+                semantic_token_ids.cpu().numpy().tobytes(),
+            ]
+        else:
+            voice = [Path(prompt_speech_path).read_bytes()]
+        return hash_bytes(
+            self._result_cache_salt,
+            repr((text, prompt_text, gender is not None)).encode(),
+            *voice,
+            repr(generation_args).encode(),
+        )
+
+    def prompt_voice(
+        self,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        voice_id: str = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, str]:
+        """
+        Tokens and transcript of the voice to clone, read from the voice library
+        for `voice_id` and otherwise tokenized from the prompt audio.
+
+        Return:
+            Tuple[torch.Tensor, torch.Tensor, str]: global tokens; semantic tokens;
+                `prompt_text`, or the transcript stored with the voice
+        """
+        if voice_id is None:
+            global_token_ids, semantic_token_ids = self.audio_tokenizer.tokenize(
+                prompt_speech_path
+            )
+            return global_token_ids, semantic_token_ids, prompt_text
+
+        if self.voice_library is None:
+            raise ValueError("voice_id requires SparkTTS(voice_library_path=...)")
+        voice = self.voice_library[voice_id]
+        return (
+            torch.from_numpy(voice.global_tokens).reshape(1, 1, -1).to(self.device),
+            torch.from_numpy(voice.semantic_tokens).unsqueeze(0).to(self.device),
+            prompt_text if prompt_text is not None else voice.prompt_text,
+        )
 
     def process_prompt(
         self,
         text: str,
         prompt_speech_path: Path,
         prompt_text: str = None,
-    ) -> Tuple[str, torch.Tensor]:
+        voice_id: str = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         """
         Process input for voice cloning.
 
@@ -63,49 +256,21 @@ class SparkTTS:
             text (str): The text input to be converted to speech.
             prompt_speech_path (Path): Path to the audio file used as a prompt.
             prompt_text (str, optional): Transcript of the prompt audio.
+            voice_id (str, optional): Voice of the voice library used instead of
+                the prompt audio.
 
         Return:
-            Tuple[str, torch.Tensor]: Input prompt; global tokens
+            Tuple[torch.Tensor, torch.Tensor]: Input ids of the prompt; global tokens
         """
 
-        global_token_ids, semantic_token_ids = self.audio_tokenizer.tokenize(
-            prompt_speech_path
+        global_token_ids, semantic_token_ids, prompt_text = self.prompt_voice(
+            prompt_speech_path, prompt_text, voice_id
         )
-        global_tokens = "".join(
-            [f"<|bicodec_global_{i}|>" for i in global_token_ids.squeeze()]
+        input_ids = self.prompt_builder.tts(
+            text, global_token_ids, prompt_text, semantic_token_ids
         )
 
-        # Prepare the input tokens for the model
-        if prompt_text is not None:
-            semantic_tokens = "".join(
-                [f"<|bicodec_semantic_{i}|>" for i in semantic_token_ids.squeeze()]
-            )
-            inputs = [
-                TASK_TOKEN_MAP["tts"],
-                "<|start_content|>",
-                prompt_text,
-                text,
-                "<|end_content|>",
-                "<|start_global_token|>",
-                global_tokens,
-                "<|end_global_token|>",
-                "<|start_semantic_token|>",
-                semantic_tokens,
-            ]
-        else:
-            inputs = [
-                TASK_TOKEN_MAP["tts"],
-                "<|start_content|>",
-                text,
-                "<|end_content|>",
-                "<|start_global_token|>",
-                global_tokens,
-                "<|end_global_token|>",
-            ]
-
-        inputs = "".join(inputs)
-
-        return inputs, global_token_ids
+        return input_ids, global_token_ids
 
     def process_prompt_control(
         self,
@@ -113,7 +278,7 @@ class SparkTTS:
         pitch: str,
         speed: str,
         text: str,
-    ):
+    ) -> torch.Tensor:
         """
         Process input for voice creation.
 
@@ -124,35 +289,97 @@ class SparkTTS:
             text (str): The text input to be converted to speech.
 
         Return:
-            str: Input prompt
+            torch.Tensor: Input ids of the prompt
         """
         assert gender in GENDER_MAP.keys()
         assert pitch in LEVELS_MAP.keys()
         assert speed in LEVELS_MAP.keys()
 
-        gender_id = GENDER_MAP[gender]
-        pitch_level_id = LEVELS_MAP[pitch]
-        speed_level_id = LEVELS_MAP[speed]
+        return self.prompt_builder.controllable_tts(text, gender, pitch, speed)
 
-        pitch_label_tokens = f"<|pitch_label_{pitch_level_id}|>"
-        speed_label_tokens = f"<|speed_label_{speed_level_id}|>"
-        gender_tokens = f"<|gender_{gender_id}|>"
+    def build_prompt(
+        self,
+        text: str,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        voice_id: str = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Build the LLM prompt for either voice creation or voice cloning.
 
-        attribte_tokens = "".join(
-            [gender_tokens, pitch_label_tokens, speed_label_tokens]
-        )
+        Return:
+            Tuple[torch.Tensor, torch.Tensor]: Input ids of the prompt; global tokens
+                (None for voice creation)
+        """
+        if gender is not None:
+            return self.process_prompt_control(gender, pitch, speed, text), None
+        return self.process_prompt(text, prompt_speech_path, prompt_text, voice_id)
 
-        control_tts_inputs = [
-            TASK_TOKEN_MAP["controllable_tts"],
-            "<|start_content|>",
-            text,
-            "<|end_content|>",
-            "<|start_style_label|>",
-            attribte_tokens,
-            "<|end_style_label|>",
-        ]
+    def extract_tokens(
+        self,
+        generated_ids: torch.Tensor,
+        global_token_ids: torch.Tensor = None,
+        loop_start: int = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Extract the generated semantic tokens (and global tokens for voice creation).
+
+        Args:
+            generated_ids (torch.Tensor): Generated ids of a single sample, without the prompt.
+            global_token_ids (torch.Tensor, optional): Global tokens of the prompt audio.
+                If None, the global tokens are parsed from the generated ids.
+            loop_start (int, optional): Index of the generated ids where a repetition
+                loop starts, see `RepetitionStoppingCriteria`. The ids from there on
+                are dropped.
 
-        return "".join(control_tts_inputs)
+        Return:
+            Tuple[torch.Tensor, torch.Tensor]: global tokens (1, 32); semantic tokens (1, T)
+        """
+        if loop_start is not None:
+            generated_ids = generated_ids[:loop_start]
+        pred_semantic_ids = self.token_parser.semantic_tokens(generated_ids).unsqueeze(0)
+
+        if global_token_ids is None:
+            global_token_ids = self.token_parser.global_tokens(generated_ids).unsqueeze(0)
+
+        return global_token_ids.reshape(1, -1), pred_semantic_ids
+
+    def generation_kwargs(
+        self, temperature: float, top_k: float, top_p: float, max_new_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        Arguments of `generate` for constrained sampling.
+
+        Temperature, top-k and top-p are applied by `SparkTTSLogitsProcessor` on the
+        legal token slice of each phase, so the built-in warpers are disabled.
+        Generation also stops early once a row degenerates into a repetition loop;
+        the `RepetitionStoppingCriteria` comes first in `stopping_criteria`, and
+        its `loop_starts` tell where to cut each stopped row.
+        """
+        token_ids = self.prompt_builder.token_ids(
+            "<|start_global_token|>", "<|end_global_token|>", "<|start_semantic_token|>"
+        ).tolist()
+        processor = SparkTTSLogitsProcessor(
+            self.prompt_builder.semantic_ids,
+            self.prompt_builder.global_ids,
+            *token_ids,
+            eos_token_id=self.tokenizer.eos_token_id,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+        )
+        return dict(
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=1.0,
+            top_k=0,
+            top_p=1.0,
+            logits_processor=LogitsProcessorList([processor]),
+            stopping_criteria=StoppingCriteriaList([RepetitionStoppingCriteria()]),
+        )
 
     @torch.no_grad()
     def inference(
@@ -166,6 +393,9 @@ class SparkTTS:
         temperature: float = 0.8,
         top_k: float = 50,
         top_p: float = 0.95,
+        max_new_tokens: int = None,
+        seed: int = None,
+        voice_id: str = None,
     ) -> torch.Tensor:
         """
         Performs inference to generate speech from text, incorporating prompt audio and/or text.
@@ -180,57 +410,512 @@ class SparkTTS:
             temperature (float, optional): Sampling temperature for controlling randomness. Default is 0.8.
             top_k (float, optional): Top-k sampling parameter. Default is 50.
             top_p (float, optional): Top-p (nucleus) sampling parameter. Default is 0.95.
+            max_new_tokens (int, optional): Generation budget. Default is estimated from the text.
+            seed (int, optional): Seed of the sampling, which makes the result
+                reproducible. Seeded results are served from the result cache.
+            voice_id (str, optional): Voice of the voice library to clone instead of
+                the prompt audio. `prompt_text` defaults to its stored transcript.
 
         Returns:
             torch.Tensor: Generated waveform as a tensor.
         """
-        if gender is not None:
-            prompt = self.process_prompt_control(gender, pitch, speed, text)
-
-        else:
-            prompt, global_token_ids = self.process_prompt(
-                text, prompt_speech_path, prompt_text
+        if max_new_tokens is None:
+            max_new_tokens = estimate_max_new_tokens(text, speed)
+
+        # Unseeded results are random draws, so only seeded ones are cached
+        cache_key = None
+        if seed is not None:
+            cache_key = self._result_cache_key(
+                text, prompt_speech_path, prompt_text, gender, pitch, speed, voice_id,
+                temperature, top_k, top_p, max_new_tokens, seed,
             )
-        model_inputs = self.tokenizer([prompt], return_tensors="pt").to(self.device)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                # Copy, so that callers cannot modify the cached waveform
+                return cached["wav"].numpy().copy()
+
+        input_ids, global_token_ids = self.build_prompt(
+            text, prompt_speech_path, prompt_text, gender, pitch, speed, voice_id
+        )
+        input_ids = input_ids.unsqueeze(0).to(self.device)
 
         # Generate speech using the model
-        generated_ids = self.model.generate(
-            **model_inputs,
-            max_new_tokens=3000,
-            do_sample=True,
-            top_k=top_k,
-            top_p=top_p,
-            temperature=temperature,
+        generation_kwargs = self.generation_kwargs(
+            temperature, top_k, top_p, max_new_tokens
         )
+        with seeded_rng(seed, self.device):
+            generated_ids = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                **generation_kwargs,
+            )
 
         # Trim the output tokens to remove the input tokens
-        generated_ids = [
-            output_ids[len(input_ids) :]
-            for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
+        generated_ids = generated_ids[0, input_ids.shape[1] :]
+
+        # Extract semantic token IDs from the generated ids, without a repetition loop
+        repetition = generation_kwargs["stopping_criteria"][0]
+        global_token_ids, pred_semantic_ids = self.extract_tokens(
+            generated_ids, global_token_ids, repetition.loop_starts.get(0)
+        )
+
+        # Convert semantic tokens back to waveform
+        wav = self.audio_tokenizer.detokenize(
+            global_token_ids.to(self.device),
+            pred_semantic_ids.to(self.device),
+        )
+
+        if cache_key is not None:
+            self.result_cache.put(
+                cache_key,
+                {
+                    "global_tokens": global_token_ids.cpu(),
+                    "semantic_tokens": pred_semantic_ids.cpu(),
+                    "wav": torch.from_numpy(np.array(wav)),
+                },
+            )
+
+        return wav
+
+    @torch.no_grad()
+    def inference_batch(
+        self,
+        texts: List[str],
+        prompt_speech_path: Union[Path, List[Path]] = None,
+        prompt_text: Union[str, List[str]] = None,
+        gender: Union[str, List[str]] = None,
+        pitch: Union[str, List[str]] = None,
+        speed: Union[str, List[str]] = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+        max_new_tokens: int = None,
+        seed: int = None,
+        voice_id: Union[str, List[str]] = None,
+    ) -> List[np.ndarray]:
+        """
+        Generates speech for several texts with a single LLM `generate` call and a
+        single vocoder pass.
 
-        # Decode the generated tokens into text
-        predicts = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        Every voice argument is either a single value shared by all texts or a list
+        with one entry per text, so voice cloning and voice creation can be mixed
+        in one batch.
 
-        # Extract semantic token IDs from the generated text
-        pred_semantic_ids = (
-            torch.tensor([int(token) for token in re.findall(r"bicodec_semantic_(\d+)", predicts)])
-            .long()
-            .unsqueeze(0)
+        Args:
+            texts (List[str]): The texts to be converted to speech.
+            prompt_speech_path (Path | List[Path]): Path(s) to the prompt audio.
+            prompt_text (str | List[str], optional): Transcript(s) of the prompt audio.
+            gender (str | List[str]): female | male.
+            pitch (str | List[str]): very_low | low | moderate | high | very_high
+            speed (str | List[str]): very_low | low | moderate | high | very_high
+            temperature (float, optional): Sampling temperature for controlling randomness. Default is 0.8.
+            top_k (float, optional): Top-k sampling parameter. Default is 50.
+            top_p (float, optional): Top-p (nucleus) sampling parameter. Default is 0.95.
+            max_new_tokens (int, optional): Generation budget. Default is estimated from
+                the longest text.
+            seed (int, optional): Seed of the sampling. The rows share one RNG, so a
+                result is only reproducible for the same batch.
+            voice_id (str | List[str], optional): Voice(s) of the voice library.
+
+        Returns:
+            List[np.ndarray]: Generated waveform of each text.
+        """
+        num_texts = len(texts)
+
+        def _per_item(value):
+            if isinstance(value, (list, tuple)):
+                assert len(value) == num_texts, "expected one value per text"
+                return list(value)
+            return [value] * num_texts
+
+        prompts, global_tokens_list = [], []
+        for item in zip(
+            texts,
+            _per_item(prompt_speech_path),
+            _per_item(prompt_text),
+            _per_item(gender),
+            _per_item(pitch),
+            _per_item(speed),
+            _per_item(voice_id),
+        ):
+            input_ids, global_token_ids = self.build_prompt(*item)
+            prompts.append(input_ids)
+            global_tokens_list.append(global_token_ids)
+
+        if max_new_tokens is None:
+            max_new_tokens = max(
+                estimate_max_new_tokens(text, speed)
+                for text, speed in zip(texts, _per_item(speed))
+            )
+
+        with seeded_rng(seed, self.device):
+            global_tokens, semantic_tokens = self.generate_tokens_batch(
+                prompts,
+                global_tokens_list,
+                **self.generation_kwargs(temperature, top_k, top_p, max_new_tokens),
+            )
+
+        return self.audio_tokenizer.detokenize_batch(global_tokens, semantic_tokens)
+
+    def generate_tokens_batch(
+        self,
+        prompts: List[torch.Tensor],
+        global_tokens_list: List[torch.Tensor],
+        **generation_kwargs,
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        """
+        Run one padded `generate` call over several prompts and parse every row.
+
+        Args:
+            prompts (List[torch.Tensor]): Input ids of each prompt. shape: (seq_len,)
+            global_tokens_list (List[torch.Tensor]): Global tokens of each prompt, or
+                None for voice creation prompts.
+            **generation_kwargs: Arguments of `generate`, see `generation_kwargs`.
+
+        Return:
+            Tuple[List[torch.Tensor], List[torch.Tensor]]: global tokens (1, 32) and
+                semantic tokens (T,) of each row
+        """
+        # Left-pad so every row continues from its last prompt token
+        input_ids, attention_mask = pad_left(prompts, self.tokenizer.pad_token_id)
+        input_ids = input_ids.to(self.device)
+
+        generated_ids = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask.to(self.device),
+            pad_token_id=self.tokenizer.pad_token_id,
+            **generation_kwargs,
+        )
+
+        # With left padding every row shares the same prompt length
+        generated_ids = generated_ids[:, input_ids.shape[1] :]
+
+        repetition = generation_kwargs["stopping_criteria"][0]
+        global_tokens, semantic_tokens = [], []
+        for row, (row_ids, global_token_ids) in enumerate(
+            zip(generated_ids, global_tokens_list)
+        ):
+            global_token_ids, pred_semantic_ids = self.extract_tokens(
+                row_ids, global_token_ids, repetition.loop_starts.get(row)
+            )
+            global_tokens.append(global_token_ids)
+            semantic_tokens.append(pred_semantic_ids.squeeze(0))
+
+        return global_tokens, semantic_tokens
+
+    @torch.no_grad()
+    def inference_stream(
+        self,
+        text: str,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+        max_new_tokens: int = None,
+        seed: int = None,
+        voice_id: str = None,
+        chunk_size: int = 50,
+        first_chunk_size: int = 15,
+        context_size: int = 25,
+        lookahead_size: int = 5,
+        incremental: bool = False,
+    ) -> Iterator[np.ndarray]:
+        """
+        Performs inference like `inference`, but yields audio chunks while the LLM is
+        still decoding.
+
+        Semantic tokens are vocoded in overlapping windows: every window reuses
+        `context_size` already emitted tokens as left context, and the audio of the
+        last `lookahead_size` tokens is held back and crossfaded with the next window,
+        which sees more right context for them.
+
+        With `incremental`, an `IncrementalBiCodecDecoder` vocodes every token once
+        and exactly instead; its audio lags `BiCodec.decode_context()` tokens behind
+        the LLM, so the first chunk comes later.
+
+        Args:
+            text, prompt_speech_path, prompt_text, gender, pitch, speed,
+            temperature, top_k, top_p, max_new_tokens, seed, voice_id: See
+                `inference`. Streamed results are not cached.
+            chunk_size (int, optional): Number of new semantic tokens per chunk (50 tokens = 1s).
+            first_chunk_size (int, optional): Number of semantic tokens of the first chunk,
+                smaller than `chunk_size` to reduce the time to first audio.
+            context_size (int, optional): Number of left context tokens per window.
+            lookahead_size (int, optional): Number of tokens held back per window.
+            incremental (bool, optional): Vocode with per-layer state instead of
+                overlapping windows; `context_size` and `lookahead_size` are unused.
+
+        Yields:
+            np.ndarray: Consecutive waveform chunks.
+        """
+        input_ids, global_token_ids = self.build_prompt(
+            text, prompt_speech_path, prompt_text, gender, pitch, speed, voice_id
+        )
+        input_ids = input_ids.unsqueeze(0).to(self.device)
+
+        if max_new_tokens is None:
+            max_new_tokens = estimate_max_new_tokens(text, speed)
+
+        streamer = TokenIdStreamer()
+        # Stops `generate` when the consumer closes the stream before its end
+        cancel = CancelStoppingCriteria()
+        generation_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            **self.generation_kwargs(temperature, top_k, top_p, max_new_tokens),
+            streamer=streamer,
+        )
+        generation_kwargs["stopping_criteria"].append(cancel)
+
+        def _generate():
+            try:
+                with seeded_rng(seed, self.device):
+                    self.model.generate(**generation_kwargs)
+            except Exception as e:
+                streamer.end(e)
+
+        thread = Thread(target=_generate, daemon=True)
+        thread.start()
+
+        hop_length = self.audio_tokenizer.config["latent_hop_length"]
+        global_tokens, semantic_tokens = [], []
+        emitted, tail = 0, None
+        decoder, yielded = None, False
+
+        def _push(final: bool) -> np.ndarray:
+            nonlocal emitted, yielded
+            new_tokens = torch.tensor([semantic_tokens[emitted:]]).long()
+            wav = decoder.push(new_tokens.to(self.device))
+            if final:
+                wav = torch.cat([wav, decoder.flush()], dim=-1)
+            emitted = len(semantic_tokens)
+            yielded = yielded or wav.shape[-1] > 0
+            return wav.reshape(-1).cpu().numpy()
+
+        def _vocode(final: bool) -> np.ndarray:
+            nonlocal emitted, tail
+            start, end = emitted, len(semantic_tokens)
+            window_start = max(0, start - context_size)
+            stop = end if final else end - lookahead_size
+
+            wav = self.audio_tokenizer.detokenize(
+                global_token_ids.to(self.device),
+                torch.tensor([semantic_tokens[window_start:end]]).long().to(self.device),
+            ).reshape(-1)
+
+            chunk = wav[(start - window_start) * hop_length : (stop - window_start) * hop_length]
+            if tail is not None:
+                chunk[: len(tail)] = crossfade(tail, chunk[: len(tail)])
+
+            emitted = stop
+            tail = None if final else wav[(stop - window_start) * hop_length :]
+            return chunk
+
+        try:
+            for new_ids in streamer:
+                new_ids = torch.tensor(new_ids)
+                semantic_tokens += self.token_parser.semantic_tokens(new_ids).tolist()
+
+                if global_token_ids is None:
+                    global_tokens += self.token_parser.global_tokens(new_ids).tolist()
+                    # Voice creation: the speaker is only known once the semantic tokens start
+                    if not semantic_tokens:
+                        continue
+                    global_token_ids = torch.tensor([global_tokens]).long()
+                global_token_ids = global_token_ids.reshape(1, -1)
+
+                if incremental:
+                    if decoder is None:
+                        decoder = self.audio_tokenizer.incremental_decoder(
+                            global_token_ids.to(self.device)
+                        )
+                    target = chunk_size if yielded else first_chunk_size
+                    if len(semantic_tokens) - emitted >= target:
+                        wav = _push(final=False)
+                        if len(wav) > 0:
+                            yield wav
+                    continue
+
+                target = first_chunk_size if emitted == 0 else chunk_size
+                if len(semantic_tokens) - emitted >= target + lookahead_size:
+                    yield _vocode(final=False)
+        finally:
+            # Also runs when the generator is closed or garbage collected early
+            cancel.cancel()
+            thread.join()
+
+        if decoder is not None:
+            wav = _push(final=True)
+            if len(wav) > 0:
+                yield wav
+        elif len(semantic_tokens) > emitted:
+            yield _vocode(final=True)
+
+
+    @torch.no_grad()
+    def inference_long_stream(
+        self,
+        text: str,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+        seed: int = None,
+        voice_id: str = None,
+        max_segment_weight: int = 200,
+        batch_size: int = 8,
+        crossfade_duration: float = 0.02,
+    ) -> Iterator[np.ndarray]:
+        """
+        Generates speech for a long text segment by segment.
+
+        The text is split at sentence and clause boundaries. The first segment is
+        synthesized alone so that its audio is returned early; the remaining
+        segments are synthesized in batches of `batch_size`. All segments share the
+        global tokens of the first one (or of the prompt audio), so the voice stays
+        consistent, and consecutive segments are joined with a short crossfade.
+
+        Args:
+            text, prompt_speech_path, prompt_text, gender, pitch, speed,
+            temperature, top_k, top_p, seed, voice_id: See `inference`. Results are
+                not cached.
+            max_segment_weight (int, optional): Maximum segment length, see `split_text`.
+            batch_size (int, optional): Number of segments per `generate` call.
+            crossfade_duration (float, optional): Crossfade between segments in seconds.
+
+        Yields:
+            np.ndarray: Consecutive waveform chunks, one or more per segment.
+        """
+        segments = split_text(text, max_segment_weight)
+        wavs = self.segment_wavs(
+            segments,
+            prompt_speech_path,
+            prompt_text,
+            gender,
+            pitch,
+            speed,
+            temperature,
+            top_k,
+            top_p,
+            seed,
+            voice_id,
+            batch_size,
         )
+        yield from crossfade_stream(wavs, int(crossfade_duration * self.sample_rate))
+
+    @torch.no_grad()
+    def segment_wavs(
+        self,
+        segments: List[str],
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+        seed: int = None,
+        voice_id: str = None,
+        batch_size: int = 8,
+    ) -> Iterator[np.ndarray]:
+        """
+        Synthesizes text segments in order, see `inference_long_stream`.
+
+        Yields:
+            np.ndarray: The waveform of each segment. A batch is only generated
+                once the caller has consumed the previous one.
+        """
+        if not segments:
+            return
 
         if gender is not None:
-            global_token_ids = (
-                torch.tensor([int(token) for token in re.findall(r"bicodec_global_(\d+)", predicts)])
-                .long()
-                .unsqueeze(0)
-                .unsqueeze(0)
+            input_ids = self.process_prompt_control(gender, pitch, speed, segments[0])
+            global_token_ids, prompt_semantic_ids = None, None
+        else:
+            global_token_ids, prompt_semantic_ids, prompt_text = self.prompt_voice(
+                prompt_speech_path, prompt_text, voice_id
+            )
+            input_ids = self.prompt_builder.tts(
+                segments[0], global_token_ids, prompt_text, prompt_semantic_ids
             )
 
-        # Convert semantic tokens back to waveform
-        wav = self.audio_tokenizer.detokenize(
-            global_token_ids.to(self.device).squeeze(0),
-            pred_semantic_ids.to(self.device),
+        # The first segment is synthesized alone and fixes the speaker for the rest
+        max_new_tokens = estimate_max_new_tokens(segments[0], speed)
+        with seeded_rng(seed, self.device):
+            (global_token_ids,), (semantic_token_ids,) = self.generate_tokens_batch(
+                [input_ids],
+                [global_token_ids],
+                **self.generation_kwargs(temperature, top_k, top_p, max_new_tokens),
+            )
+        yield from self.audio_tokenizer.detokenize_batch(
+            [global_token_ids], [semantic_token_ids]
         )
 
-        return wav
\ No newline at end of file
+        for start in range(1, len(segments), batch_size):
+            batch = segments[start : start + batch_size]
+
+            # Voice creation continues as voice cloning of the first segment's speaker
+            prompts = [
+                self.prompt_builder.tts(
+                    segment, global_token_ids, prompt_text, prompt_semantic_ids
+                )
+                for segment in batch
+            ]
+            max_new_tokens = max(
+                estimate_max_new_tokens(segment, speed) for segment in batch
+            )
+            # Every batch is seeded on its own, since the caller runs between yields
+            with seeded_rng(None if seed is None else seed + start, self.device):
+                _, semantic_tokens = self.generate_tokens_batch(
+                    prompts,
+                    [global_token_ids] * len(batch),
+                    **self.generation_kwargs(temperature, top_k, top_p, max_new_tokens),
+                )
+            yield from self.audio_tokenizer.detokenize_batch(
+                [global_token_ids] * len(batch), semantic_tokens
+            )
+
+    def inference_long(self, text: str, **kwargs) -> np.ndarray:
+        """
+        Generates speech for a long text, see `inference_long_stream`.
+
+        Returns:
+            np.ndarray: Generated waveform.
+        """
+        chunks = list(self.inference_long_stream(text, **kwargs))
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(chunks)
+
+
+# Test the long text synthesis
+if __name__ == "__main__":
+
+    model = SparkTTS("pretrained_models/SparkTTS-0.5B", torch.device("cpu"))
+    voice = dict(gender="female", pitch="moderate", speed="moderate", seed=0)
+    batch_size, fade_length = 8, int(0.02 * model.sample_rate)
+
+    # Segment counts around the batch size, most of them not 1 mod batch_size
+    for num_segments in [1, 2, 3, 9, 10, 17]:
+        text = " ".join(f"Sentence number {i} is here." for i in range(num_segments))
+        segments = split_text(text, max_weight=40)
+        assert len(segments) == num_segments, segments
+
+        wavs = list(model.segment_wavs(segments, batch_size=batch_size, **voice))
+        expected = np.concatenate(list(crossfade_stream(wavs, fade_length)))
+        wav = model.inference_long(
+            text, max_segment_weight=40, batch_size=batch_size, **voice
+        )
+        if len(wavs) == num_segments and np.array_equal(wav, expected):
+            print(f"Test successful: {num_segments} segments")
+        else:
+            print(f"Test failed: {num_segments} segments, {len(wavs)} synthesized")
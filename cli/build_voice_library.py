@@ -0,0 +1,150 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Tokenize reference clips once and write them into a voice library, which
+    `SparkTTS(voice_library_path=...)` serves by voice ID.
+
+    The input is either a directory, whose audio files become voices named by
+    their path relative to it (an optional .txt file beside a clip holds its
+    transcript), or a JSONL manifest with "voice_id", "audio_path" and optional
+    "prompt_text" fields; any other fields are kept as metadata.
+
+    python -m cli.build_voice_library --input voices/ --output voices.bin
+"""
+
+import os
+import argparse
+import logging
+import torch
+
+from pathlib import Path
+from typing import Dict, List
+
+from sparktts.utils.file import read_jsonl
+from sparktts.utils.voice_library import Voice, write_voice_library
+from sparktts.models.audio_tokenizer import BiCodecTokenizer
+
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg")
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Build a voice library.")
+
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=True,
+        help="Directory of reference clips, or a JSONL manifest",
+    )
+    parser.add_argument("--output", type=str, required=True, help="Library file")
+    parser.add_argument("--device", type=str, default="cpu", help="Torch device")
+    parser.add_argument(
+        "--batch_size", type=int, default=16, help="Clips per wav2vec2 pass"
+    )
+    return parser.parse_args()
+
+
+def scan_directory(input_dir: Path) -> List[Dict]:
+    """Manifest entries of every audio file below `input_dir`."""
+    entries = []
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            path = Path(root) / name
+            if path.suffix.lower() not in AUDIO_EXTENSIONS:
+                continue
+            transcript = path.with_suffix(".txt")
+            entries.append(
+                {
+                    "voice_id": path.relative_to(input_dir).with_suffix("").as_posix(),
+                    "audio_path": str(path),
+                    "prompt_text": (
+                        transcript.read_text(encoding="utf-8").strip()
+                        if transcript.exists()
+                        else None
+                    ),
+                }
+            )
+    return entries
+
+
+def build_library(
+    audio_tokenizer: BiCodecTokenizer,
+    entries: List[Dict],
+    output_path: Path,
+    batch_size: int = 16,
+) -> Path:
+    """Tokenize the clips of the manifest entries and write the library."""
+    voices = []
+    # Tokenize in groups of 16 batches to report progress
+    for start in range(0, len(entries), batch_size * 16):
+        chunk = entries[start : start + batch_size * 16]
+        tokens = audio_tokenizer.tokenize_batch(
+            [entry["audio_path"] for entry in chunk], batch_size=batch_size
+        )
+        for entry, (global_tokens, semantic_tokens) in zip(chunk, tokens):
+            metadata = {
+                key: value
+                for key, value in entry.items()
+                if key not in ("voice_id", "prompt_text")
+            }
+            voices.append(
+                Voice(
+                    voice_id=entry["voice_id"],
+                    global_tokens=global_tokens.cpu().numpy(),
+                    semantic_tokens=semantic_tokens.cpu().numpy(),
+                    prompt_text=entry.get("prompt_text"),
+                    metadata=metadata,
+                )
+            )
+        logging.info(f"Tokenized {len(voices)}/{len(entries)} clips")
+
+    info = {
+        "model_dir": str(audio_tokenizer.model_dir),
+        "sample_rate": audio_tokenizer.config["sample_rate"],
+    }
+    return write_voice_library(voices, output_path, info)
+
+
+def run_build(args):
+    """Read the input, tokenize every clip and write the library."""
+    if os.path.isdir(args.input):
+        entries = scan_directory(Path(args.input))
+    else:
+        entries = read_jsonl(args.input)
+    logging.info(f"Building a library of {len(entries)} voices from {args.input}")
+
+    audio_tokenizer = BiCodecTokenizer(
+        args.model_dir, device=torch.device(args.device), prompt_cache_size=0
+    )
+    build_library(audio_tokenizer, entries, args.output, args.batch_size)
+    logging.info(f"Voice library saved at: {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    args = parse_args()
+    run_build(args)
@@ -0,0 +1,69 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import argparse
+import logging
+import numpy as np
+import torch
+
+from sparktts.models.bicodec import BiCodec
+from sparktts.models.onnx_decoder import OnnxBiCodecDecoder, export_bicodec_decoder
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Export the BiCodec decoder to ONNX.")
+
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B/BiCodec/decoder.onnx",
+        help="Path of the exported graph",
+    )
+    parser.add_argument("--opset_version", type=int, default=17, help="ONNX opset")
+    return parser.parse_args()
+
+
+def run_export(args):
+    """Export the decoder and check it against the PyTorch model."""
+    logging.info(f"Exporting {args.model_dir}/BiCodec to {args.output_path}")
+    export_bicodec_decoder(
+        f"{args.model_dir}/BiCodec", args.output_path, args.opset_version
+    )
+
+    model = BiCodec.load_from_checkpoint(f"{args.model_dir}/BiCodec", decode_only=True)
+    decoder = OnnxBiCodecDecoder(args.output_path)
+    semantic_tokens = torch.randint(0, 8192, (2, 73))
+    global_tokens = torch.randint(0, 4096, (2, 1, 32))
+
+    expected = model.detokenize(semantic_tokens, global_tokens).numpy()
+    actual = decoder.detokenize(semantic_tokens.numpy(), global_tokens.numpy())
+    logging.info(f"Max abs difference to PyTorch: {np.abs(expected - actual).max():.2e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    args = parse_args()
+    run_export(args)
@@ -51,6 +51,14 @@ def parse_args():
         type=str,
         help="Path to the prompt audio file",
     )
+    parser.add_argument(
+        "--voice_library",
+        type=str,
+        help="Voice library built by cli/build_voice_library.py",
+    )
+    parser.add_argument(
+        "--voice_id", type=str, help="Voice of the voice library to clone"
+    )
     parser.add_argument("--gender", choices=["male", "female"])
     parser.add_argument(
         "--pitch", choices=["very_low", "low", "moderate", "high", "very_high"]
@@ -58,6 +66,25 @@ def parse_args():
     parser.add_argument(
         "--speed", choices=["very_low", "low", "moderate", "high", "very_high"]
     )
+    parser.add_argument(
+        "--dtype",
+        choices=["float32", "bfloat16", "float16"],
+        default="float32",
+        help="Compute dtype of the models; quantizers always run in float32",
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=["int8-dynamic"],
+        help="Quantize the LLM and BiCodec prenet Linears (CPU only)",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Seed of the sampling, for reproducible audio"
+    )
+    parser.add_argument(
+        "--long_form",
+        action="store_true",
+        help="Split long texts into segments and synthesize them in batches",
+    )
     return parser.parse_args()
 
 
@@ -84,7 +111,13 @@ def run_tts(args):
         logging.info("GPU acceleration not available, using CPU")
 
     # Initialize the model
-    model = SparkTTS(args.model_dir, device)
+    model = SparkTTS(
+        args.model_dir,
+        device,
+        dtype=getattr(torch, args.dtype),
+        quantize=args.quantize,
+        voice_library_path=args.voice_library,
+    )
 
     # Generate unique filename using timestamp
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -94,13 +127,16 @@ def run_tts(args):
 
     # Perform inference and save the output audio
     with torch.no_grad():
-        wav = model.inference(
+        synthesize = model.inference_long if args.long_form else model.inference
+        wav = synthesize(
             args.text,
-            args.prompt_speech_path,
+            prompt_speech_path=args.prompt_speech_path,
             prompt_text=args.prompt_text,
             gender=args.gender,
             pitch=args.pitch,
             speed=args.speed,
+            seed=args.seed,
+            voice_id=args.voice_id,
         )
         sf.write(save_path, wav, samplerate=16000)
 
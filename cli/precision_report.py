@@ -0,0 +1,205 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Compare a reduced precision (bf16/fp16) or int8 quantized SparkTTS against
+    the fp32 model.
+
+    For every prompt audio the report gives the agreement of the global and
+    semantic tokens of the audio tokenizer. For every text the fp32 model
+    generates a reference sequence, which is used to measure the top-1
+    agreement of both LLMs under teacher forcing and the SNR of the waveforms
+    that both BiCodec decoders produce from the same tokens.
+
+    python -m cli.precision_report --prompt_speech_path example/prompt_audio.wav \\
+        --text "..." --dtype bfloat16
+    python -m cli.precision_report --prompt_speech_path example/prompt_audio.wav \\
+        --text "..." --quantize int8-dynamic
+"""
+
+
+import argparse
+import logging
+import numpy as np
+import torch
+
+from typing import Dict, List
+
+from cli.SparkTTS import SparkTTS
+from sparktts.utils.generation import estimate_max_new_tokens
+from sparktts.utils.quantization import QUANTIZE_MODES
+
+
+DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Compare SparkTTS against fp32.")
+
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument("--device", type=str, default="cpu", help="Torch device")
+    parser.add_argument(
+        "--dtype",
+        choices=list(DTYPES.keys()),
+        default="float32",
+        help="Compute dtype of the compared model",
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=QUANTIZE_MODES,
+        help="Weight quantization of the compared model",
+    )
+    parser.add_argument(
+        "--prompt_speech_path",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Prompt audio files; the first one is also the voice of the texts",
+    )
+    parser.add_argument("--prompt_text", type=str, help="Transcript of the first prompt audio")
+    parser.add_argument(
+        "--text", type=str, nargs="+", required=True, help="Texts to generate"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the reference generation")
+    return parser.parse_args()
+
+
+def token_agreement(reference: torch.Tensor, candidate: torch.Tensor) -> float:
+    """Fraction of positions where two token sequences agree."""
+    reference, candidate = reference.reshape(-1).cpu(), candidate.reshape(-1).cpu()
+    if len(reference) != len(candidate):
+        return 0.0
+    return (reference == candidate).float().mean().item()
+
+
+def snr(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """Signal-to-noise ratio of `candidate` against `reference` in dB."""
+    noise = np.sum((reference - candidate) ** 2)
+    return float(10 * np.log10(np.sum(reference**2) / max(noise, 1e-20)))
+
+
+@torch.no_grad()
+def compare_tokenizers(
+    reference: SparkTTS, candidate: SparkTTS, prompt_speech_paths: List[str]
+) -> List[Dict[str, float]]:
+    """Token agreement of the audio tokenizers on every prompt audio."""
+    results = []
+    for path in prompt_speech_paths:
+        ref_global, ref_semantic = reference.audio_tokenizer.tokenize(path)
+        cand_global, cand_semantic = candidate.audio_tokenizer.tokenize(path)
+        results.append(
+            {
+                "global": token_agreement(ref_global, cand_global),
+                "semantic": token_agreement(ref_semantic, cand_semantic),
+            }
+        )
+    return results
+
+
+@torch.no_grad()
+def compare_generation(
+    reference: SparkTTS,
+    candidate: SparkTTS,
+    text: str,
+    prompt_speech_path: str,
+    prompt_text: str = None,
+) -> Dict[str, float]:
+    """LLM top-1 agreement and vocoder SNR on a sequence generated by `reference`."""
+    input_ids, global_token_ids = reference.build_prompt(
+        text, prompt_speech_path, prompt_text
+    )
+    input_ids = input_ids.unsqueeze(0).to(reference.device)
+    sequence = reference.model.generate(
+        input_ids=input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        **reference.generation_kwargs(0.8, 50, 0.95, estimate_max_new_tokens(text)),
+    )
+
+    # Teacher forcing: next-token predictions at every generated position
+    prompt_length = input_ids.shape[1]
+    predictions = []
+    for model in (reference, candidate):
+        logits = model.model(sequence.to(model.device)).logits
+        predictions.append(logits[0, prompt_length - 1 : -1].argmax(-1))
+
+    global_token_ids, semantic_token_ids = reference.extract_tokens(
+        sequence[0, prompt_length:], global_token_ids
+    )
+    wavs = [
+        model.audio_tokenizer.detokenize(
+            global_token_ids.to(model.device), semantic_token_ids.to(model.device)
+        )
+        for model in (reference, candidate)
+    ]
+
+    return {
+        "llm_top1": token_agreement(*predictions),
+        "vocoder_snr_db": snr(*wavs),
+        "semantic_tokens": semantic_token_ids.shape[-1],
+    }
+
+
+def run_report(args):
+    """Load both models and log the comparison."""
+    device = torch.device(args.device)
+    reference = SparkTTS(args.model_dir, device)
+    candidate = SparkTTS(
+        args.model_dir, device, dtype=DTYPES[args.dtype], quantize=args.quantize
+    )
+    label = args.quantize or args.dtype
+
+    logging.info(f"Audio tokenizer agreement, {label} vs float32")
+    for path, result in zip(
+        args.prompt_speech_path,
+        compare_tokenizers(reference, candidate, args.prompt_speech_path),
+    ):
+        logging.info(
+            f"{path}: global {result['global']:.2%}, semantic {result['semantic']:.2%}"
+        )
+
+    logging.info(f"Generation, {label} vs float32")
+    torch.manual_seed(args.seed)
+    for text in args.text:
+        result = compare_generation(
+            reference,
+            candidate,
+            text,
+            args.prompt_speech_path[0],
+            args.prompt_text,
+        )
+        logging.info(
+            f"{text[:40]!r}: LLM top-1 {result['llm_top1']:.2%}, "
+            f"vocoder SNR {result['vocoder_snr_db']:.1f} dB "
+            f"({result['semantic_tokens']} semantic tokens)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    args = parse_args()
+    run_report(args)
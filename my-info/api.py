@@ -32,11 +32,14 @@ MODEL_DIR = "pretrained_models/Spark-TTS-0.5B"
 DEFAULT_SAVE_DIR = "example/results"
 DEFAULT_PROMPT_TEXT = "吃燕窝就选燕之屋，本节目由26年专注高品质燕窝的燕之屋冠名播出。豆奶牛奶换着喝，营养更均衡，本节目由豆本豆豆奶特约播出。"
 DEFAULT_PROMPT_SPEECH_PATH = "example/prompt_audio.wav"
+# Built by `python -m cli.build_voice_library`; requests select its voices by voice_id
+VOICE_LIBRARY_PATH = "pretrained_models/voices.bin"
 
 class TTSRequest(BaseModel):
     text: str
     prompt_text: Optional[str] = None
     prompt_speech_path: Optional[str] = None
+    voice_id: Optional[str] = None
     save_dir: Optional[str] = None
 
 class TTSResponse(BaseModel):
@@ -100,6 +103,7 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
     logger.info(f"  - Text: {request.text}")
     logger.info(f"  - Prompt text2: {prompt_text}")
     logger.info(f"  - Prompt speech path: {prompt_speech_path}")
+    logger.info(f"  - Voice ID: {request.voice_id}")
     logger.info(f"  - Using device: {'cuda' if torch.cuda.is_available() else 'cpu'}")
     
     try:
@@ -116,9 +120,17 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
             "--device", "0" if torch.cuda.is_available() else "cpu",
             "--save_dir", save_dir,
             "--model_dir", MODEL_DIR,
-            "--prompt_text", prompt_text,  # Use the full default prompt
-            "--prompt_speech_path", prompt_speech_path
         ]
+        if request.voice_id:
+            # Library voices carry their own tokens and transcript, no audio is read
+            cmd += ["--voice_library", VOICE_LIBRARY_PATH, "--voice_id", request.voice_id]
+            if request.prompt_text:
+                cmd += ["--prompt_text", request.prompt_text]
+        else:
+            cmd += [
+                "--prompt_text", prompt_text,  # Use the full default prompt
+                "--prompt_speech_path", prompt_speech_path
+            ]
         
         logger.info(f"Running command: {' '.join(cmd)}")
         
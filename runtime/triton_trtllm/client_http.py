@@ -29,6 +29,9 @@ import json
 import numpy as np
 import argparse
 
+# Transcript of the default --reference-audio
+DEFAULT_REFERENCE_TEXT = "吃燕窝就选燕之屋，本节目由26年专注高品质燕窝的燕之屋冠名播出。豆奶牛奶换着喝，营养更均衡，本节目由豆本豆豆奶特约播出。"
+
 def get_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -51,8 +54,15 @@ def get_args():
     parser.add_argument(
         "--reference-text",
         type=str,
-        default="吃燕窝就选燕之屋，本节目由26年专注高品质燕窝的燕之屋冠名播出。豆奶牛奶换着喝，营养更均衡，本节目由豆本豆豆奶特约播出。",
-        help="",
+        default=None,
+        help="Transcript of the reference audio; defaults to that of the default audio, or to the stored transcript with --voice-id",
+    )
+
+    parser.add_argument(
+        "--voice-id",
+        type=str,
+        default=None,
+        help="Voice of the server's voice library, used instead of --reference-audio",
     )
 
     parser.add_argument(
@@ -139,6 +149,32 @@ def prepare_request(
 
     return data
 
+def prepare_voice_request(voice_id, target_text, reference_text=None):
+    inputs = [
+        {
+            "name": "voice_id",
+            "shape": [1, 1],
+            "datatype": "BYTES",
+            "data": [voice_id]
+        },
+        {
+            "name": "target_text",
+            "shape": [1, 1],
+            "datatype": "BYTES",
+            "data": [target_text]
+        }
+    ]
+    if reference_text is not None:
+        inputs.append(
+            {
+                "name": "reference_text",
+                "shape": [1, 1],
+                "datatype": "BYTES",
+                "data": [reference_text]
+            }
+        )
+    return {"inputs": inputs}
+
 if __name__ == "__main__":
     args = get_args()
     server_url = args.server_url
@@ -146,11 +182,15 @@ if __name__ == "__main__":
         server_url = f"http://{server_url}"
     
     url = f"{server_url}/v2/models/{args.model_name}/infer"
-    waveform, sr = sf.read(args.reference_audio)
-    assert sr == 16000, "sample rate hardcoded in server"
-    
-    samples = np.array(waveform, dtype=np.float32)
-    data = prepare_request(samples, args.reference_text, args.target_text)
+    if args.voice_id:
+        data = prepare_voice_request(args.voice_id, args.target_text, args.reference_text)
+    else:
+        waveform, sr = sf.read(args.reference_audio)
+        assert sr == 16000, "sample rate hardcoded in server"
+
+        samples = np.array(waveform, dtype=np.float32)
+        reference_text = args.reference_text or DEFAULT_REFERENCE_TEXT
+        data = prepare_request(samples, reference_text, args.target_text)
 
     rsp = requests.post(
         url,
@@ -56,33 +56,6 @@ class TritonPythonModel:
         self.audio_tokenizer = BiCodecTokenizer(model_params["model_dir"], 
                                               device=self.device)
 
-    def get_ref_clip(self, wav: np.ndarray) -> np.ndarray:
-        """Extract reference audio clip for speaker embedding.
-        
-        Args:
-            wav: Input waveform array
-            
-        Returns:
-            Reference clip of fixed duration
-        """
-        SAMPLE_RATE = 16000
-        REF_SEGMENT_DURATION = 6  # seconds
-        LATENT_HOP_LENGTH = 320
-
-        ref_segment_length = (
-            int(SAMPLE_RATE * REF_SEGMENT_DURATION)
-            // LATENT_HOP_LENGTH
-            * LATENT_HOP_LENGTH
-        )
-        wav_length = len(wav)
-
-        if ref_segment_length > wav_length:
-            # Repeat and truncate if input is too short
-            repeat_times = ref_segment_length // wav_length + 1
-            wav = np.tile(wav, repeat_times)
-
-        return wav[:ref_segment_length]
-
     def execute(self, requests):
         """Execute inference on the batched requests.
         
@@ -93,7 +66,6 @@ class TritonPythonModel:
             List of inference responses containing tokenized outputs
         """
         reference_wav_list = []
-        reference_wav_ref_clip_list = []
 
         # Process each request in batch
         for request in requests:
@@ -106,29 +78,17 @@ class TritonPythonModel:
             # Prepare inputs
             wav = wav_array[:, :wav_len].squeeze(0)
             reference_wav_list.append(wav)
-            
-            wav_ref_clip = self.get_ref_clip(wav)
-            reference_wav_ref_clip_list.append(torch.from_numpy(wav_ref_clip))
 
-        # Batch process through tokenizer
-        ref_wav_clip_tensor = torch.stack(reference_wav_ref_clip_list, dim=0)
-        wav2vec2_features = self.audio_tokenizer.extract_wav2vec2_features(
-            reference_wav_list)
-        
-        audio_tokenizer_input = {
-            "ref_wav": ref_wav_clip_tensor.to(self.device),
-            "feat": wav2vec2_features.to(self.device),
-        }
-        semantic_tokens, global_tokens = self.audio_tokenizer.model.tokenize(
-            audio_tokenizer_input)
+        # Batch process through tokenizer; every item is trimmed to its own length
+        tokens = self.audio_tokenizer.tokenize_wavs(reference_wav_list)
 
         # Prepare responses
         responses = []
-        for i in range(len(requests)):
+        for global_tokens, semantic_tokens in tokens:
             global_tokens_tensor = pb_utils.Tensor.from_dlpack(
-                "global_tokens", to_dlpack(global_tokens[i]))
+                "global_tokens", to_dlpack(global_tokens[0]))
             semantic_tokens_tensor = pb_utils.Tensor.from_dlpack(
-                "semantic_tokens", to_dlpack(semantic_tokens[i]))
+                "semantic_tokens", to_dlpack(semantic_tokens[0]))
             
             inference_response = pb_utils.InferenceResponse(
                 output_tensors=[global_tokens_tensor, semantic_tokens_tensor])
@@ -26,7 +26,6 @@
 
 import json
 import os
-import re
 from typing import Dict, List, Tuple, Optional, Union
 
 import numpy as np
@@ -35,66 +34,9 @@ from torch.utils.dlpack import from_dlpack, to_dlpack
 import triton_python_backend_utils as pb_utils
 from transformers import AutoTokenizer
 
-from sparktts.utils.token_parser import TASK_TOKEN_MAP
-
-def process_prompt(
-    text: str,
-    prompt_text: Optional[str] = None,
-    global_token_ids: torch.Tensor = None,
-    semantic_token_ids: torch.Tensor = None,
-) -> Tuple[str, torch.Tensor]:
-    """
-    Process input for voice cloning.
-
-    Args:
-        text: The text input to be converted to speech.
-        prompt_text: Transcript of the prompt audio.
-        global_token_ids: Global token IDs extracted from reference audio.
-        semantic_token_ids: Semantic token IDs extracted from reference audio.
-
-    Returns:
-        Tuple containing the formatted input prompt and global token IDs.
-    """
-    # Convert global tokens to string format
-    global_tokens = "".join(
-        [f"<|bicodec_global_{i}|>" for i in global_token_ids.squeeze()]
-    )
-
-    
-    # Prepare the input tokens for the model
-    if prompt_text is not None:
-        # Include semantic tokens when prompt text is provided
-        semantic_tokens = "".join(
-            [f"<|bicodec_semantic_{i}|>" for i in semantic_token_ids.squeeze()]
-        )
-
-        inputs = [
-            TASK_TOKEN_MAP["tts"],
-            "<|start_content|>",
-            prompt_text,
-            text,
-            "<|end_content|>",
-            "<|start_global_token|>",
-            global_tokens,
-            "<|end_global_token|>",
-            "<|start_semantic_token|>",
-            semantic_tokens,
-        ]
-    else:
-        # Without prompt text, exclude semantic tokens
-        inputs = [
-            TASK_TOKEN_MAP["tts"],
-            "<|start_content|>",
-            text,
-            "<|end_content|>",
-            "<|start_global_token|>",
-            global_tokens,
-            "<|end_global_token|>",
-        ]
-
-    # Join all input components into a single string
-    inputs = "".join(inputs)
-    return inputs, global_token_ids
+from sparktts.utils.generation import estimate_max_new_tokens
+from sparktts.utils.token_parser import PromptIdBuilder, GeneratedTokenParser
+from sparktts.utils.voice_library import VoiceLibrary
 
 
 class TritonPythonModel:
@@ -117,10 +59,22 @@ class TritonPythonModel:
         # Initialize tokenizer
         llm_tokenizer_dir = model_params["llm_tokenizer_dir"]
         self.tokenizer = AutoTokenizer.from_pretrained(llm_tokenizer_dir)
+        self.prompt_builder = PromptIdBuilder(self.tokenizer)
+        self.token_parser = GeneratedTokenParser(
+            self.prompt_builder.semantic_ids,
+            self.prompt_builder.global_ids,
+            len(self.tokenizer),
+        )
         self.device = torch.device("cuda")
         self.decoupled = False
 
-    def forward_llm(self, input_ids):
+        # Optional voice library; unfilled template values count as unset
+        voice_library_path = model_params.get("voice_library_path", "")
+        self.voice_library = None
+        if voice_library_path and not voice_library_path.startswith("${"):
+            self.voice_library = VoiceLibrary(voice_library_path)
+
+    def forward_llm(self, input_ids, max_tokens: int = 512):
         """
         Prepares the response from the language model based on the provided
         inputs. Creates a `pb_utils.InferenceRequest` object with passed
@@ -140,6 +94,7 @@ class TritonPythonModel:
         Parameters
         ----------
         - llm_request_inputs (dict): A dictionary containing the inputs for the language model.
+        - max_tokens (int): Upper bound on the number of generated tokens.
 
         Returns
         -------
@@ -147,7 +102,6 @@ class TritonPythonModel:
         """
         # convert input_ids to numpy, with shape [1, sequence_length]
         input_ids = input_ids.cpu().numpy()
-        max_tokens = 512
         input_dict = {
             "request_output_len": np.array([[max_tokens]], dtype=np.int32),
             "end_id": np.array([[self.tokenizer.eos_token_id]], dtype=np.int32),
@@ -246,6 +200,27 @@ class TritonPythonModel:
         waveform = torch.utils.dlpack.from_dlpack(waveform.to_dlpack()).cpu()
         
         return waveform
+
+    def voice_tokens(self, voice_id: str):
+        """Global and semantic tokens and transcript of a voice of the voice library.
+
+        Args:
+            voice_id: ID of the voice
+
+        Returns:
+            Tuple of global tokens (1, global_dim), semantic tokens and the transcript
+        """
+        if self.voice_library is None:
+            raise pb_utils.TritonModelException(
+                "voice_id requires the voice_library_path parameter")
+        try:
+            voice = self.voice_library[voice_id]
+        except KeyError as e:
+            raise pb_utils.TritonModelException(str(e))
+
+        global_tokens = torch.from_numpy(voice.global_tokens).to(torch.int32).reshape(1, -1)
+        semantic_tokens = torch.from_numpy(voice.semantic_tokens).to(torch.int32)
+        return global_tokens, semantic_tokens, voice.prompt_text
         
     def execute(self, requests):
         """Execute inference on the batched requests.
@@ -259,47 +234,52 @@ class TritonPythonModel:
         responses = []
         
         for request in requests:
-            # Extract input tensors
-            wav = pb_utils.get_input_tensor_by_name(request, "reference_wav")
-            wav_len = pb_utils.get_input_tensor_by_name(request, "reference_wav_len")
-            
-            # Process reference audio through audio tokenizer
-            global_tokens, semantic_tokens = self.forward_audio_tokenizer(wav, wav_len)
-            
-            # Extract text inputs
-            reference_text = pb_utils.get_input_tensor_by_name(request, "reference_text").as_numpy()
-            reference_text = reference_text[0][0].decode('utf-8')
+            voice_id = pb_utils.get_input_tensor_by_name(request, "voice_id")
+            reference_text = pb_utils.get_input_tensor_by_name(request, "reference_text")
+            if reference_text is not None:
+                reference_text = reference_text.as_numpy()[0][0].decode('utf-8')
+
+            if voice_id is not None:
+                # Library voices skip the audio tokenizer entirely
+                voice_id = voice_id.as_numpy()[0][0].decode('utf-8')
+                global_tokens, semantic_tokens, voice_text = self.voice_tokens(voice_id)
+                if not reference_text:
+                    reference_text = voice_text
+            else:
+                # Extract input tensors
+                wav = pb_utils.get_input_tensor_by_name(request, "reference_wav")
+                wav_len = pb_utils.get_input_tensor_by_name(request, "reference_wav_len")
+
+                # Process reference audio through audio tokenizer
+                global_tokens, semantic_tokens = self.forward_audio_tokenizer(wav, wav_len)
             
             target_text = pb_utils.get_input_tensor_by_name(request, "target_text").as_numpy()
             target_text = target_text[0][0].decode('utf-8')
             
-            # Prepare prompt for LLM
-            prompt, global_token_ids = process_prompt(
+            # Build LLM input ids directly from the audio token indices
+            input_ids = self.prompt_builder.tts(
                 text=target_text,
+                global_tokens=global_tokens,
                 prompt_text=reference_text,
-                global_token_ids=global_tokens,
-                semantic_token_ids=semantic_tokens,
+                semantic_tokens=semantic_tokens,
             )
-            
-            
-            # Tokenize prompt for LLM
-            model_inputs = self.tokenizer([prompt], return_tensors="pt").to(self.device)
-            input_ids = model_inputs.input_ids.to(torch.int32)
+            input_ids = input_ids.unsqueeze(0).to(torch.int32)
             
             # Generate semantic tokens with LLM
-            generated_ids = self.forward_llm(input_ids)
+            # Bound generation by the expected duration of the target text
+            max_tokens = estimate_max_new_tokens(target_text, max_new_tokens=512)
+            generated_ids = self.forward_llm(input_ids, max_tokens)
             
-            # Decode and extract semantic token IDs from generated text
-            predicted_text = self.tokenizer.batch_decode([generated_ids], skip_special_tokens=True)[0]
+            # Map generated ids straight to semantic token indices
             pred_semantic_ids = (
-                torch.tensor([int(token) for token in re.findall(r"bicodec_semantic_(\d+)", predicted_text)])
+                self.token_parser.semantic_tokens(torch.from_numpy(generated_ids))
                 .unsqueeze(0).to(torch.int32)
             )
             
 
             # Generate audio with vocoder
             audio = self.forward_vocoder(
-                global_token_ids.to(self.device),
+                global_tokens.to(self.device),
                 pred_semantic_ids.to(self.device),
             )
             
@@ -29,12 +29,10 @@ import os
 import logging
 from typing import List, Dict
 
-import torch
-from torch.utils.dlpack import to_dlpack
-
+import numpy as np
 import triton_python_backend_utils as pb_utils
 
-from sparktts.models.bicodec import BiCodec
+from sparktts.models.onnx_decoder import OnnxBiCodecDecoder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -44,7 +42,8 @@ class TritonPythonModel:
     """Triton Python model for vocoder.
     
     This model takes global and semantic tokens as input and generates audio waveforms
-    using the BiCodec vocoder.
+    using the BiCodec vocoder. When `onnx_decoder_path` is set, the decoder runs on
+    ONNX Runtime and PyTorch is never imported.
     """
 
     def initialize(self, args):
@@ -57,17 +56,44 @@ class TritonPythonModel:
         parameters = json.loads(args['model_config'])['parameters']
         model_params = {key: value["string_value"] for key, value in parameters.items()}
         model_dir = model_params["model_dir"]
-        
-        # Initialize device and vocoder
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Initializing vocoder from {model_dir} on {self.device}")
-        
-        self.vocoder = BiCodec.load_from_checkpoint(f"{model_dir}/BiCodec")
-        del self.vocoder.encoder, self.vocoder.postnet
-        self.vocoder.eval().to(self.device)  # Set model to evaluation mode
+
+        # Unfilled template values count as unset
+        onnx_decoder_path = model_params.get("onnx_decoder_path", "")
+        if onnx_decoder_path.startswith("${"):
+            onnx_decoder_path = ""
+
+        if onnx_decoder_path:
+            logger.info(f"Initializing ONNX Runtime vocoder from {onnx_decoder_path}")
+            self.vocoder = OnnxBiCodecDecoder(onnx_decoder_path)
+            self.torch = None
+        else:
+            import torch
+            from sparktts.models.bicodec import BiCodec
+
+            # Initialize device and vocoder
+            self.torch = torch
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            logger.info(f"Initializing vocoder from {model_dir} on {self.device}")
+
+            self.vocoder = BiCodec.load_from_checkpoint(
+                f"{model_dir}/BiCodec", decode_only=True
+            )
+            self.vocoder.eval().to(self.device)  # Set model to evaluation mode
 
         logger.info("Vocoder initialized successfully")
 
+    def _detokenize(self, global_tokens: np.ndarray, semantic_tokens: np.ndarray) -> np.ndarray:
+        """Decode a batch of tokens into waveforms of shape (batch, samples)."""
+        if self.torch is None:
+            return self.vocoder.detokenize(semantic_tokens, global_tokens)[:, 0]
+
+        torch = self.torch
+        with torch.no_grad():
+            wavs = self.vocoder.detokenize(
+                torch.from_numpy(semantic_tokens).to(self.device),
+                torch.from_numpy(global_tokens).to(self.device).unsqueeze(1),
+            )
+        return wavs[:, 0].cpu().numpy()
 
     def execute(self, requests):
         """Execute inference on the batched requests.
@@ -84,22 +110,20 @@ class TritonPythonModel:
         for request in requests:
             global_tokens_tensor = pb_utils.get_input_tensor_by_name(request, "global_tokens").as_numpy()
             semantic_tokens_tensor = pb_utils.get_input_tensor_by_name(request, "semantic_tokens").as_numpy()
-            global_tokens_list.append(torch.from_numpy(global_tokens_tensor).to(self.device))
-            semantic_tokens_list.append(torch.from_numpy(semantic_tokens_tensor).to(self.device))
+            global_tokens_list.append(global_tokens_tensor.astype(np.int64))
+            semantic_tokens_list.append(semantic_tokens_tensor.astype(np.int64))
 
         # Concatenate tokens for batch processing
-        global_tokens = torch.cat(global_tokens_list, dim=0)
-        semantic_tokens = torch.cat(semantic_tokens_list, dim=0)
-        
+        global_tokens = np.concatenate(global_tokens_list, axis=0)
+        semantic_tokens = np.concatenate(semantic_tokens_list, axis=0)
 
         # Generate waveforms
-        with torch.no_grad():
-            wavs = self.vocoder.detokenize(semantic_tokens, global_tokens.unsqueeze(1))
+        wavs = self._detokenize(global_tokens, semantic_tokens)
 
         # Prepare responses
         responses = []
         for i in range(len(requests)):
-            wav_tensor = pb_utils.Tensor.from_dlpack("waveform", to_dlpack(wavs[i]))
+            wav_tensor = pb_utils.Tensor("waveform", wavs[i : i + 1].astype(np.float32))
             inference_response = pb_utils.InferenceResponse(output_tensors=[wav_tensor])
             responses.append(inference_response)
                              
@@ -8,6 +8,10 @@ huggingface_model_local_dir=../../pretrained_models/Spark-TTS-0.5B
 trt_dtype=bfloat16
 trt_weights_dir=./tllm_checkpoint_${trt_dtype}
 trt_engines_dir=./trt_engines_${trt_dtype}
+# Optional BiCodec decoder exported by cli/export_onnx.py; empty runs the vocoder in PyTorch
+onnx_decoder_path=
+# Optional voice library built by cli/build_voice_library.py, for requests with a voice_id
+voice_library_path=
 
 model_repo=./model_repo_test
 
@@ -40,13 +44,15 @@ if [ $stage -le 2 ] && [ $stop_stage -ge 2 ]; then
     ENGINE_PATH=$trt_engines_dir
     MAX_QUEUE_DELAY_MICROSECONDS=0
     MODEL_DIR=$huggingface_model_local_dir
+    ONNX_DECODER_PATH=$onnx_decoder_path
+    VOICE_LIBRARY_PATH=$voice_library_path
     LLM_TOKENIZER_DIR=$huggingface_model_local_dir/LLM
     BLS_INSTANCE_NUM=4
     TRITON_MAX_BATCH_SIZE=16
 
-    python3 scripts/fill_template.py -i ${model_repo}/vocoder/config.pbtxt model_dir:${MODEL_DIR},triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS}
+    python3 scripts/fill_template.py -i ${model_repo}/vocoder/config.pbtxt model_dir:${MODEL_DIR},onnx_decoder_path:${ONNX_DECODER_PATH},triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS}
     python3 scripts/fill_template.py -i ${model_repo}/audio_tokenizer/config.pbtxt model_dir:${MODEL_DIR},triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS}
-    python3 scripts/fill_template.py -i ${model_repo}/spark_tts/config.pbtxt bls_instance_num:${BLS_INSTANCE_NUM},llm_tokenizer_dir:${LLM_TOKENIZER_DIR},triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS}
+    python3 scripts/fill_template.py -i ${model_repo}/spark_tts/config.pbtxt bls_instance_num:${BLS_INSTANCE_NUM},llm_tokenizer_dir:${LLM_TOKENIZER_DIR},voice_library_path:${VOICE_LIBRARY_PATH},triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS}
     python3 scripts/fill_template.py -i ${model_repo}/tensorrt_llm/config.pbtxt triton_backend:tensorrtllm,triton_max_batch_size:${TRITON_MAX_BATCH_SIZE},decoupled_mode:False,max_beam_width:1,engine_dir:${ENGINE_PATH},max_tokens_in_paged_kv_cache:2560,max_attention_window_size:2560,kv_cache_free_gpu_mem_fraction:0.5,exclude_input_in_output:True,enable_kv_cache_reuse:False,batching_strategy:inflight_fused_batching,max_queue_delay_microseconds:${MAX_QUEUE_DELAY_MICROSECONDS},encoder_input_features_data_type:TYPE_FP16,logits_datatype:TYPE_FP32
 
 fi
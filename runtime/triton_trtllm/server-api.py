@@ -52,6 +52,8 @@ class TTSRequest(BaseModel):
     text: str
     reference_text: Optional[str] = None
     reference_audio: Optional[str] = None
+    # Voice of the server's voice library, replaces reference_audio and reference_text
+    voice_id: Optional[str] = None
     save_dir: Optional[str] = None
 
 class TTSResponse(BaseModel):
@@ -91,7 +93,11 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
     request.text = text
     
     # Set up parameters with detailed logging
-    if request.reference_text:
+    if request.voice_id:
+        # The voice library holds the tokens and transcript of the voice
+        reference_text = request.reference_text
+        logger.info(f"Using voice library voice: {request.voice_id}")
+    elif request.reference_text:
         reference_text = request.reference_text
         logger.info(f"Using provided reference text: {reference_text}")
     else:
@@ -105,7 +111,9 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
             }
         )
     
-    if request.reference_audio:
+    if request.voice_id:
+        reference_audio = None
+    elif request.reference_audio:
         reference_audio = request.reference_audio
         logger.info(f"Using provided reference audio: {reference_audio}")
     else:
@@ -144,69 +152,72 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         client_script = os.path.join(script_dir, "client_http.py")
         output_path = os.path.join(spark_tts_root, save_dir, "output.wav")
-        ref_audio_path = os.path.join(spark_tts_root, reference_audio)
+        ref_audio_path = os.path.join(spark_tts_root, reference_audio or "")
         
         logger.info(f"Client script path: {client_script}")
         logger.info(f"Output audio path: {output_path}")
-        logger.info(f"Reference audio path: {ref_audio_path}")
+        if reference_audio is not None:
+            logger.info(f"Reference audio path: {ref_audio_path}")
         
         # Check if client script exists
         if not os.path.exists(client_script):
             raise Exception(f"Client script not found at {client_script}")
         
-        # Check if the reference audio exists
-        if not os.path.exists(ref_audio_path):
-            logger.warning(f"Reference audio file not found: {ref_audio_path}")
-            return TTSResponse(
-                errcode=400,
-                message=f"Reference audio file not found: {reference_audio}",
-                data={
-                    "inference_time": 0.0,
-                    "text": request.text,
-                    "saved_filename": ""
-                }
-            )
+        processed_ref_audio_path = None
+        if reference_audio is not None:
+            # Check if the reference audio exists
+            if not os.path.exists(ref_audio_path):
+                logger.warning(f"Reference audio file not found: {ref_audio_path}")
+                return TTSResponse(
+                    errcode=400,
+                    message=f"Reference audio file not found: {reference_audio}",
+                    data={
+                        "inference_time": 0.0,
+                        "text": request.text,
+                        "saved_filename": ""
+                    }
+                )
         
-        # Process reference audio - check if it's 16kHz mono and convert if needed
-        processed_ref_audio_path = ref_audio_path
-        try:
-            # Check audio properties using librosa
-            y, sr = librosa.load(ref_audio_path, sr=None, mono=False)
+            # Process reference audio - check if it's 16kHz mono and convert if needed
+            processed_ref_audio_path = ref_audio_path
+            try:
+                # Check audio properties using librosa
+                y, sr = librosa.load(ref_audio_path, sr=None, mono=False)
             
-            # Log original audio properties
-            channels = 1 if len(y.shape) == 1 else y.shape[0]
-            logger.info(f"Reference audio properties: Sample rate: {sr} Hz, Channels: {channels}")
+                # Log original audio properties
+                channels = 1 if len(y.shape) == 1 else y.shape[0]
+                logger.info(f"Reference audio properties: Sample rate: {sr} Hz, Channels: {channels}")
             
-            # Check if conversion is needed (not 16kHz or not mono)
-            if sr != 16000 or channels > 1:
-                logger.warning(f"AUDIO CONVERSION NEEDED: '{ref_audio_path}' is not in 16kHz mono format")
-                if sr != 16000:
-                    logger.warning(f"SAMPLE RATE CONVERSION: Converting from {sr}Hz to 16000Hz")
-                if channels > 1:
-                    logger.warning(f"CHANNEL CONVERSION: Converting from {channels} channels to mono")
+                # Check if conversion is needed (not 16kHz or not mono)
+                if sr != 16000 or channels > 1:
+                    logger.warning(f"AUDIO CONVERSION NEEDED: '{ref_audio_path}' is not in 16kHz mono format")
+                    if sr != 16000:
+                        logger.warning(f"SAMPLE RATE CONVERSION: Converting from {sr}Hz to 16000Hz")
+                    if channels > 1:
+                        logger.warning(f"CHANNEL CONVERSION: Converting from {channels} channels to mono")
                 
-                # Create a processed version with _16k_mono suffix
-                file_name, ext = os.path.splitext(ref_audio_path)
-                processed_ref_audio_path = f"{file_name}_16k_mono{ext}"
+                    # Create a processed version with _16k_mono suffix
+                    file_name, ext = os.path.splitext(ref_audio_path)
+                    processed_ref_audio_path = f"{file_name}_16k_mono{ext}"
                 
-                # Convert to mono if needed
-                if channels > 1:
-                    y = librosa.to_mono(y)
-                    logger.info(f"Converted audio to mono")
+                    # Convert to mono if needed
+                    if channels > 1:
+                        y = librosa.to_mono(y)
+                        logger.info(f"Converted audio to mono")
                 
-                # Resample to 16kHz if needed
-                if sr != 16000:
-                    y = librosa.resample(y, orig_sr=sr, target_sr=16000)
-                    logger.info(f"Resampled audio to 16kHz")
+                    # Resample to 16kHz if needed
+                    if sr != 16000:
+                        y = librosa.resample(y, orig_sr=sr, target_sr=16000)
+                        logger.info(f"Resampled audio to 16kHz")
                 
-                # Save processed audio
-                sf.write(processed_ref_audio_path, y, 16000, 'PCM_16')
-                logger.warning(f"AUDIO CONVERSION COMPLETE: Saved 16kHz mono version to '{processed_ref_audio_path}'")
-            else:
-                logger.info("Reference audio is already in the correct format (16kHz mono)")
-        except Exception as e:
-            logger.error(f"ERROR DURING AUDIO CONVERSION: {str(e)}")
-            logger.warning("Using the original reference audio file")
+                    # Save processed audio
+                    sf.write(processed_ref_audio_path, y, 16000, 'PCM_16')
+                    logger.warning(f"AUDIO CONVERSION COMPLETE: Saved 16kHz mono version to '{processed_ref_audio_path}'")
+                else:
+                    logger.info("Reference audio is already in the correct format (16kHz mono)")
+            except Exception as e:
+                logger.error(f"ERROR DURING AUDIO CONVERSION: {str(e)}")
+                logger.warning("Using the original reference audio file")
         
         # Run the command with python3 which is verified to work with English text
         cmd = [
@@ -214,10 +225,14 @@ async def tts(request: TTSRequest, background_tasks: BackgroundTasks):
             client_script,
             "--server-url", "localhost:9002",
             "--output-audio", output_path,
-            "--reference-audio", processed_ref_audio_path,
-            "--reference-text", reference_text,
             "--target-text", request.text
         ]
+        if request.voice_id:
+            cmd += ["--voice-id", request.voice_id]
+        else:
+            cmd += ["--reference-audio", processed_ref_audio_path]
+        if reference_text:
+            cmd += ["--reference-text", reference_text]
         
         logger.info(f"Running command: {' '.join(cmd)}")
         
@@ -14,45 +14,158 @@
 # limitations under the License.
 
 
+import os
 import torch
+import threading
 import numpy as np
 
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import List, Tuple, Union
 from transformers import Wav2Vec2FeatureExtractor, Wav2Vec2Model
 
 from sparktts.utils.file import load_config
-from sparktts.utils.audio import load_audio
+from sparktts.utils.audio import AudioLoader
+from sparktts.utils.cache import DiskCache, LRUCache, hash_bytes
+from sparktts.utils.quantization import check_quantize_mode
 from sparktts.models.bicodec import BiCodec
+from sparktts.models.compiled_decoder import CompiledBiCodecDecoder
+from sparktts.models.incremental_decoder import IncrementalBiCodecDecoder
+from sparktts.models.onnx_decoder import OnnxBiCodecDecoder
+
+
+# wav2vec2 hidden states averaged into the BiCodec input features. hidden_states[i]
+# is the output of transformer layer i - 1, so only the first 16 layers are needed.
+WAV2VEC2_FEATURE_LAYERS = (11, 14, 16)
 
 
 class BiCodecTokenizer:
     """BiCodec tokenizer for handling audio input and tokenization."""
 
-    def __init__(self, model_dir: Path, device: torch.device = None, **kwargs):
+    def __init__(
+        self,
+        model_dir: Path,
+        device: torch.device = None,
+        prompt_cache_size: int = 16,
+        prompt_cache_dir: Path = None,
+        decode_only: bool = False,
+        dtype: torch.dtype = None,
+        quantize: str = None,
+        compile_decoder: bool = False,
+        compile_cache_dir: Path = None,
+        onnx_decoder_path: Path = None,
+        audio_cache_size: int = 16,
+        resample_quality: str = "VHQ",
+        decode_window: int = None,
+        **kwargs,
+    ):
         super().__init__()
         """
         Args:
             model_dir: Path to the model directory.
             device: Device to run the model on (default is GPU if available).
+            prompt_cache_size: Number of tokenized prompt audios kept in memory.
+            prompt_cache_dir: Optional directory that persists tokenized prompt audios.
+            decode_only: Only load what `detokenize` needs; wav2vec2 and the BiCodec
+                encoder parts are never loaded and `tokenize` raises.
+            dtype: Compute dtype of wav2vec2 and BiCodec (default fp32). The BiCodec
+                quantizers always run in fp32.
+            quantize: "int8-dynamic" to quantize the BiCodec prenet Linears (CPU only).
+            compile_decoder: Decode with TorchScript graphs traced per length bucket,
+                see `CompiledBiCodecDecoder`.
+            compile_cache_dir: Optional directory that persists the traced graphs.
+            onnx_decoder_path: Decode with ONNX Runtime using a graph exported by
+                `export_bicodec_decoder`. With `decode_only` the PyTorch BiCodec is
+                not loaded at all.
+            audio_cache_size: Number of loaded and normalized prompt audios kept in
+                memory, keyed by path and modification time.
+            resample_quality: soxr quality of resampling prompt audio to 16 kHz.
+            decode_window: Decode longer semantic sequences in windows of this many
+                tokens, which bounds the decoder memory, see `BiCodec.decode_windowed`.
         """
         self.device = device
         self.model_dir = model_dir
+        self.decode_only = decode_only
+        self.dtype = dtype
+        self.quantize = quantize
+        self.onnx_decoder_path = onnx_decoder_path
+        self.decode_window = decode_window
+        check_quantize_mode(quantize, dtype, device)
+        if compile_decoder and onnx_decoder_path is not None:
+            raise ValueError("compile_decoder and onnx_decoder_path are exclusive")
+        if decode_window is not None and onnx_decoder_path is not None:
+            raise ValueError("decode_window is not supported with onnx_decoder_path")
         self.config = load_config(f"{model_dir}/config.yaml")
+        self.audio_loader = AudioLoader(
+            sampling_rate=self.config["sample_rate"],
+            volume_normalize=self.config["volume_normalize"],
+            resample_quality=resample_quality,
+            cache_size=audio_cache_size,
+        )
+        self.prompt_cache = LRUCache(
+            prompt_cache_size,
+            DiskCache(prompt_cache_dir) if prompt_cache_dir is not None else None,
+        )
         self._initialize_model()
+        self._prompt_cache_salt = self._get_prompt_cache_salt()
+
+        # Module that turns tokens into waveforms, BiCodec itself unless compiled
+        self.decoder = self.model
+        if onnx_decoder_path is not None:
+            self.decoder = OnnxBiCodecDecoder(onnx_decoder_path)
+        elif compile_decoder:
+            self.decoder = CompiledBiCodecDecoder(
+                self.model,
+                cache_dir=compile_cache_dir,
+                cache_salt=self._prompt_cache_salt + repr(quantize).encode(),
+            )
 
     def _initialize_model(self):
         """Load and initialize the BiCodec model and Wav2Vec2 feature extractor."""
-        self.model = BiCodec.load_from_checkpoint(f"{self.model_dir}/BiCodec").to(
-            self.device
-        )
+        if self.decode_only and self.onnx_decoder_path is not None:
+            self.model, self.processor, self.feature_extractor = None, None, None
+            return
+
+        self.model = BiCodec.load_from_checkpoint(
+            f"{self.model_dir}/BiCodec",
+            decode_only=self.decode_only,
+            dtype=self.dtype,
+            quantize=self.quantize,
+        ).to(self.device)
+        if self.decode_only:
+            self.processor, self.feature_extractor = None, None
+            return
+
         self.processor = Wav2Vec2FeatureExtractor.from_pretrained(
             f"{self.model_dir}/wav2vec2-large-xlsr-53"
         )
-        self.feature_extractor = Wav2Vec2Model.from_pretrained(
+        self.feature_extractor = self._load_truncated_wav2vec2(
             f"{self.model_dir}/wav2vec2-large-xlsr-53"
         ).to(self.device)
-        self.feature_extractor.config.output_hidden_states = True
+
+    def _load_truncated_wav2vec2(self, model_path: str) -> Wav2Vec2Model:
+        """Load wav2vec2 with only the transformer layers that feed the BiCodec features.
+
+        The outputs of the feature layers are captured by forward hooks, so the
+        model is run without `output_hidden_states`.
+        """
+        model = Wav2Vec2Model.from_pretrained(
+            model_path,
+            num_hidden_layers=max(WAV2VEC2_FEATURE_LAYERS),
+            torch_dtype=self.dtype,
+        )
+        if model.config.do_stable_layer_norm:
+            # Only the hooked layer outputs are used, skip the final layer norm
+            model.encoder.layer_norm = torch.nn.Identity()
+
+        self._wav2vec2_outputs = threading.local()
+
+        def _capture(module, args, output):
+            self._wav2vec2_outputs.hidden_states.append(output[0])
+
+        for index in WAV2VEC2_FEATURE_LAYERS:
+            model.encoder.layers[index - 1].register_forward_hook(_capture)
+
+        return model
 
     def get_ref_clip(self, wav: np.ndarray) -> np.ndarray:
         """Get reference audio clip for speaker embedding."""
@@ -71,54 +184,169 @@ class BiCodecTokenizer:
 
     def process_audio(self, wav_path: Path) -> Tuple[np.ndarray, torch.Tensor]:
         """load auido and get reference audio from wav path"""
-        wav = load_audio(
-            wav_path,
-            sampling_rate=self.config["sample_rate"],
-            volume_normalize=self.config["volume_normalize"],
-        )
+        wav = self.audio_loader.load(wav_path)
 
         wav_ref = self.get_ref_clip(wav)
 
         wav_ref = torch.from_numpy(wav_ref).unsqueeze(0).float()
         return wav, wav_ref
 
-    def extract_wav2vec2_features(self, wavs: torch.Tensor) -> torch.Tensor:
-        """extract wav2vec2 features"""
+    def extract_wav2vec2_features(
+        self, wavs: Union[np.ndarray, List[np.ndarray]]
+    ) -> torch.Tensor:
+        """extract wav2vec2 features
+
+        Args:
+            wavs: one waveform, or a list of waveforms of any lengths. Padded
+                samples are normalized and attended to as in unpadded inputs.
+
+        Returns:
+            feats_mix: features. shape: (batch_size, max_frames, feat_dim); the
+                frames of each item beyond `feature_lengths` are padding
+        """
         inputs = self.processor(
             wavs,
             sampling_rate=16000,
             return_tensors="pt",
             padding=True,
-            output_hidden_states=True,
-        ).input_values
-        feat = self.feature_extractor(inputs.to(self.feature_extractor.device))
-        feats_mix = (
-            feat.hidden_states[11] + feat.hidden_states[14] + feat.hidden_states[16]
-        ) / 3
+            return_attention_mask=True,
+        )
+        self._wav2vec2_outputs.hidden_states = []
+        self.feature_extractor(
+            inputs.input_values.to(
+                self.feature_extractor.device, self.feature_extractor.dtype
+            ),
+            attention_mask=inputs.attention_mask.to(self.feature_extractor.device),
+        )
+        hidden_states = self._wav2vec2_outputs.hidden_states
+        self._wav2vec2_outputs.hidden_states = None
+
+        feats_mix = (hidden_states[0] + hidden_states[1] + hidden_states[2]) / 3
 
         return feats_mix
 
-    def tokenize_batch(self, batch: Dict[str, Any]) -> torch.Tensor:
-        """tokenize the batch of audio
+    def feature_lengths(self, wav_lengths: List[int]) -> List[int]:
+        """number of wav2vec2 frames, and so of semantic tokens, of each waveform"""
+        lengths = self.feature_extractor._get_feat_extract_output_lengths(
+            torch.tensor(wav_lengths)
+        )
+        return lengths.tolist()
+
+    def tokenize_wavs(
+        self, wavs: List[np.ndarray]
+    ) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """tokenize loaded waveforms of different lengths together
+
+        wav2vec2 runs once over the padded batch with an attention mask, and the
+        speaker encoder once over the equal-length reference clips. The semantic
+        encoder runs per item on the trimmed features: its convolutions would mix
+        padding into the last frames, so batching it would break the equality
+        with `tokenize`.
 
         Args:
-            batch:
-                wavs (List[np.ndarray]): batch of audio
-                ref_wavs (torch.Tensor): reference audio. shape: (batch_size, seq_len)
+            wavs: loaded waveforms, see `process_audio`
 
         Returns:
-            semantic_tokens: semantic tokens. shape: (batch_size, seq_len, latent_dim)
-            global_tokens: global tokens. shape: (batch_size, seq_len, global_dim)
+            tokens: global tokens (1, 1, global_dim) and semantic tokens
+                (1, seq_len) of each waveform, as returned by `tokenize`
         """
-        feats = self.extract_wav2vec2_features(batch["wav"])
-        batch["feat"] = feats
-        semantic_tokens, global_tokens = self.model.tokenize(batch)
+        self._check_encoder()
+        ref_wavs = torch.stack(
+            [torch.from_numpy(self.get_ref_clip(wav)).float() for wav in wavs]
+        )
+        global_tokens = self.model.tokenize_global(ref_wavs.to(self.device))
 
-        return global_tokens, semantic_tokens
+        feats = self.extract_wav2vec2_features(wavs).to(self.device)
+        lengths = self.feature_lengths([len(wav) for wav in wavs])
+
+        return [
+            (
+                global_tokens[i : i + 1],
+                self.model.tokenize_semantic(feats[i : i + 1, :length]),
+            )
+            for i, length in enumerate(lengths)
+        ]
+
+    def tokenize_batch(
+        self, audio_paths: List[str], batch_size: int = 16
+    ) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """tokenize several audio files, reusing the tokens of previously seen audio
+
+        Uncached files are sorted by length and tokenized `batch_size` at a time,
+        so that little of each batch is padding.
+
+        Args:
+            audio_paths: audio files of any lengths
+            batch_size: number of waveforms per wav2vec2 pass
+
+        Returns:
+            tokens: (global_tokens, semantic_tokens) of each file, as returned by
+                `tokenize`
+        """
+        self._check_encoder()
+        results, keys, pending = [None] * len(audio_paths), [], []
+        for i, wav in enumerate(self.audio_loader.load_many(audio_paths)):
+            key = hash_bytes(self._prompt_cache_salt, wav.tobytes())
+            cached = self.prompt_cache.get(key)
+            if cached is not None:
+                results[i] = tuple(tokens.to(self.device) for tokens in cached)
+            else:
+                pending.append((i, wav))
+            keys.append(key)
+
+        pending.sort(key=lambda item: len(item[1]))
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start : start + batch_size]
+            tokens = self.tokenize_wavs([wav for _, wav in chunk])
+            for (i, _), (global_tokens, semantic_tokens) in zip(chunk, tokens):
+                results[i] = (global_tokens, semantic_tokens)
+                self.prompt_cache.put(
+                    keys[i], (global_tokens.cpu(), semantic_tokens.cpu())
+                )
+
+        return results
+
+    def _check_encoder(self):
+        if self.decode_only:
+            raise RuntimeError(
+                "BiCodecTokenizer was loaded with decode_only=True and cannot "
+                "tokenize audio; use voice creation or load the full model"
+            )
+
+    def _get_prompt_cache_salt(self) -> bytes:
+        """Identify the config and checkpoint that prompt tokens depend on."""
+        ckpt_stat = os.stat(f"{self.model_dir}/BiCodec/model.safetensors")
+        salt = [
+            self.config["sample_rate"],
+            self.config["ref_segment_duration"],
+            self.config["latent_hop_length"],
+            self.config["volume_normalize"],
+            ckpt_stat.st_size,
+            ckpt_stat.st_mtime_ns,
+            str(self.dtype),
+        ]
+        return repr(salt).encode()
 
     def tokenize(self, audio_path: str) -> Tuple[torch.Tensor, torch.Tensor]:
-        """tokenize the audio"""
+        """tokenize the audio, reusing the tokens of previously seen audio"""
+        self._check_encoder()
         wav, ref_wav = self.process_audio(audio_path)
+
+        key = hash_bytes(self._prompt_cache_salt, wav.tobytes())
+        cached = self.prompt_cache.get(key)
+        if cached is not None:
+            global_tokens, semantic_tokens = cached
+            return global_tokens.to(self.device), semantic_tokens.to(self.device)
+
+        global_tokens, semantic_tokens = self._tokenize(wav, ref_wav)
+        self.prompt_cache.put(key, (global_tokens.cpu(), semantic_tokens.cpu()))
+
+        return global_tokens, semantic_tokens
+
+    def _tokenize(
+        self, wav: np.ndarray, ref_wav: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """tokenize the loaded audio"""
         feat = self.extract_wav2vec2_features(wav)
         batch = {
             "wav": torch.from_numpy(wav).unsqueeze(0).float().to(self.device),
@@ -129,6 +357,25 @@ class BiCodecTokenizer:
 
         return global_tokens, semantic_tokens
 
+    def _decode(
+        self, semantic_tokens: torch.Tensor, global_tokens: torch.Tensor
+    ) -> np.ndarray:
+        """run the decoder, whether PyTorch or ONNX Runtime, and return numpy audio"""
+        if isinstance(self.decoder, OnnxBiCodecDecoder):
+            return self.decoder.detokenize(
+                semantic_tokens.cpu().numpy(), global_tokens.cpu().numpy()
+            )
+        if (
+            self.decode_window is not None
+            and semantic_tokens.shape[-1] > self.decode_window
+        ):
+            wav_rec = self.model.detokenize(
+                semantic_tokens, global_tokens, window_size=self.decode_window
+            )
+        else:
+            wav_rec = self.decoder.detokenize(semantic_tokens, global_tokens)
+        return wav_rec.detach().cpu().numpy()
+
     def detokenize(
         self, global_tokens: torch.Tensor, semantic_tokens: torch.Tensor
     ) -> np.array:
@@ -142,8 +389,60 @@ class BiCodecTokenizer:
             wav_rec: waveform. shape: (batch_size, seq_len) for batch or (seq_len,) for single
         """
         global_tokens = global_tokens.unsqueeze(1)
-        wav_rec = self.model.detokenize(semantic_tokens, global_tokens)
-        return wav_rec.detach().squeeze().cpu().numpy()
+        wav_rec = self._decode(semantic_tokens, global_tokens)
+        return wav_rec.squeeze()
+
+    def incremental_decoder(
+        self, global_tokens: torch.Tensor
+    ) -> IncrementalBiCodecDecoder:
+        """start decoding a stream whose semantic tokens arrive in chunks
+
+        Args:
+            global_tokens: global tokens. shape: (batch_size, global_dim)
+
+        Returns:
+            decoder: see `IncrementalBiCodecDecoder`, always running PyTorch
+        """
+        if self.model is None:
+            raise RuntimeError(
+                "incremental decoding needs the PyTorch BiCodec, which is not "
+                "loaded with decode_only and onnx_decoder_path"
+            )
+        return IncrementalBiCodecDecoder(self.model, global_tokens.unsqueeze(1))
+
+    def detokenize_batch(
+        self, global_tokens: List[torch.Tensor], semantic_tokens: List[torch.Tensor]
+    ) -> List[np.ndarray]:
+        """detokenize several utterances of different lengths in one padded pass
+
+        Shorter utterances are padded by repeating their last token. The decoder
+        is not causal, so the last frames of a padded utterance still differ
+        slightly from decoding it alone; the rest is identical up to float rounding.
+
+        Args:
+            global_tokens: global tokens of each utterance. shape: (1, global_dim)
+            semantic_tokens: semantic tokens of each utterance. shape: (seq_len,)
+
+        Returns:
+            wavs: waveform of each utterance, trimmed to its own length
+        """
+        if len(semantic_tokens) == 0:
+            return []
+
+        hop_length = self.config["latent_hop_length"]
+        lengths = [len(tokens) for tokens in semantic_tokens]
+        max_length = max(max(lengths), 1)
+
+        padded = torch.zeros(len(semantic_tokens), max_length, dtype=torch.long)
+        for i, tokens in enumerate(semantic_tokens):
+            padded[i, : lengths[i]] = tokens
+            if 0 < lengths[i] < max_length:
+                padded[i, lengths[i] :] = tokens[-1]
+
+        global_tokens = torch.cat(global_tokens, dim=0).to(self.device).unsqueeze(1)
+        wav_rec = self._decode(padded.to(self.device), global_tokens).squeeze(1)
+
+        return [wav[: length * hop_length] for wav, length in zip(wav_rec, lengths)]
 
 
 # test
@@ -13,14 +13,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import torch
 import torch.nn as nn
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
 from omegaconf import DictConfig
-from safetensors.torch import load_file
+from safetensors import safe_open
 
 from sparktts.utils.file import load_config
+from sparktts.utils.cache import LRUCache
+from sparktts.utils.quantization import (
+    check_quantize_mode,
+    linear_names,
+    quantize_linear_dynamic,
+)
 from sparktts.modules.speaker.speaker_encoder import SpeakerEncoder
 from sparktts.modules.encoder_decoder.feat_encoder import Encoder
 from sparktts.modules.encoder_decoder.feat_decoder import Decoder
@@ -28,6 +35,24 @@ from sparktts.modules.encoder_decoder.wave_generator import WaveGenerator
 from sparktts.modules.vq.factorized_vector_quantize import FactorizedVectorQuantize
 
 
+class SpeakerConditioning(NamedTuple):
+    """Speaker d-vector and the prenet AdaLayerNorm scales and shifts derived from it."""
+
+    d_vector: torch.Tensor
+    modulations: List[Tuple[torch.Tensor, torch.Tensor]]
+
+    @classmethod
+    def cat(cls, conditionings: List["SpeakerConditioning"]) -> "SpeakerConditioning":
+        """Stack the conditionings of single speakers into a batch."""
+        return cls(
+            torch.cat([c.d_vector for c in conditionings]),
+            [
+                tuple(torch.cat(tensors) for tensors in zip(*layer))
+                for layer in zip(*[c.modulations for c in conditionings])
+            ],
+        )
+
+
 class BiCodec(nn.Module):
     """
     BiCodec model for speech synthesis, incorporating a speaker encoder, feature encoder/decoder,
@@ -64,28 +89,49 @@ class BiCodec(nn.Module):
         self.speaker_encoder = speaker_encoder
         self.prenet = prenet
         self.postnet = postnet
+        self.compute_dtype = torch.float32
+        # Conditioning of recently decoded speakers, see `speaker_conditioning`
+        self.speaker_cache = LRUCache(64)
         self.init_mel_transformer(mel_params)
 
     @classmethod
-    def load_from_checkpoint(cls, model_dir: Path, **kwargs) -> "BiCodec":
+    def load_from_checkpoint(
+        cls,
+        model_dir: Path,
+        decode_only: bool = False,
+        dtype: torch.dtype = None,
+        quantize: str = None,
+        **kwargs,
+    ) -> "BiCodec":
         """
         Loads the model from a checkpoint.
 
         Args:
             model_dir (Path): Path to the model directory containing checkpoint and config.
+            decode_only (bool): Only build and load the modules used by `detokenize`.
+                The encoder, postnet, quantizer input projection and the speaker
+                encoder's ECAPA-TDNN and perceiver are never instantiated.
+            dtype (torch.dtype, optional): Compute dtype, see `set_dtype`.
+            quantize (str, optional): "int8-dynamic" to quantize the prenet, see
+                `quantize_dynamic`.
         
         Returns:
             BiCodec: The initialized BiCodec model.
         """
+        check_quantize_mode(quantize, dtype)
         ckpt_path = f'{model_dir}/model.safetensors'
         config = load_config(f'{model_dir}/config.yaml')['audio_tokenizer']
         mel_params = config["mel_params"]
-        encoder = Encoder(**config["encoder"])
-        quantizer = FactorizedVectorQuantize(**config["quantizer"])
+        encoder = None if decode_only else Encoder(**config["encoder"])
+        quantizer = FactorizedVectorQuantize(
+            **config["quantizer"], decode_only=decode_only
+        )
         prenet = Decoder(**config["prenet"])
-        postnet = Decoder(**config["postnet"])
+        postnet = None if decode_only else Decoder(**config["postnet"])
         decoder = WaveGenerator(**config["decoder"])
-        speaker_encoder = SpeakerEncoder(**config["speaker_encoder"])
+        speaker_encoder = SpeakerEncoder(
+            **config["speaker_encoder"], decode_only=decode_only
+        )
 
         model = cls(
             mel_params=mel_params,
@@ -97,7 +143,14 @@ class BiCodec(nn.Module):
             postnet=postnet,
         )
 
-        state_dict = load_file(ckpt_path)
+        # Only read the tensors of modules that were built
+        expected_keys = model.state_dict().keys()
+        with safe_open(ckpt_path, framework="pt") as f:
+            state_dict = {
+                key: f.get_tensor(key)
+                for key in f.keys()
+                if not decode_only or key in expected_keys
+            }
         missing_keys, unexpected_keys = model.load_state_dict(state_dict, strict=False)
 
         for key in missing_keys:
@@ -107,9 +160,57 @@ class BiCodec(nn.Module):
 
         model.eval()
         model.remove_weight_norm()
+        if dtype is not None:
+            model.set_dtype(dtype)
+        if quantize is not None:
+            model.quantize_dynamic()
 
         return model
 
+    def quantize_dynamic(self) -> "BiCodec":
+        """
+        Quantizes the ConvNeXt pointwise Linears of the prenet to dynamic int8.
+
+        They hold most of the prenet compute. The quantizers, the speaker
+        projection and the AdaLayerNorm conditioning stay in float. The model
+        must stay on CPU afterwards.
+
+        Returns:
+            BiCodec: The model itself.
+        """
+        names = linear_names(
+            self,
+            lambda name: name.startswith("prenet.")
+            and name.endswith(("pwconv1", "pwconv2")),
+        )
+        quantize_linear_dynamic(self, names)
+        return self
+
+    def set_dtype(self, dtype: torch.dtype) -> "BiCodec":
+        """
+        Runs the encoder, decoder and speaker networks in `dtype` (e.g. torch.bfloat16).
+
+        The quantizers and the mel transform stay in fp32, so token indices are
+        searched and decoded in full precision; activations are cast at their
+        boundaries and waveforms are always returned in fp32.
+
+        Args:
+            dtype (torch.dtype): Compute dtype of the non-quantizer modules.
+
+        Returns:
+            BiCodec: The model itself.
+        """
+        # Cast module by module: rounding the quantizers to `dtype` and back
+        # to fp32 would change their codebooks
+        keep = (self.quantizer, self.speaker_encoder.quantizer, self.mel_transformer)
+        for module in (self, self.speaker_encoder):
+            for child in module.children():
+                if child not in keep and child is not self.speaker_encoder:
+                    child.to(dtype)
+        self.compute_dtype = dtype
+        self.speaker_cache.clear()
+        return self
+
     def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
         """
         Performs a forward pass through the model.
@@ -120,6 +221,7 @@ class BiCodec(nn.Module):
         Returns:
             dict: A dictionary containing the reconstruction, features, and other metrics.
         """
+        self._check_encoder()
         feat = batch["feat"]
         mel = self.mel_transformer(batch["ref_wav"]).squeeze(1)
 
@@ -159,34 +261,190 @@ class BiCodec(nn.Module):
         Returns:
             tuple: Semantic tokens and global tokens.
         """
-        feat = batch["feat"]
-        mel = self.mel_transformer(batch["ref_wav"]).squeeze(1)
-
-        z = self.encoder(feat.transpose(1, 2))
-        semantic_tokens = self.quantizer.tokenize(z)
-        global_tokens = self.speaker_encoder.tokenize(mel.transpose(1, 2))
+        semantic_tokens = self.tokenize_semantic(batch["feat"])
+        global_tokens = self.tokenize_global(batch["ref_wav"])
 
         return semantic_tokens, global_tokens
 
     @torch.no_grad()
-    def detokenize(self, semantic_tokens, global_tokens):
+    def tokenize_semantic(self, feat: torch.Tensor) -> torch.Tensor:
+        """
+        Tokenizes wav2vec2 features into semantic tokens.
+
+        Args:
+            feat (tensor): wav2vec2 features. shape: (batch_size, seq_len, feat_dim)
+
+        Returns:
+            tensor: Semantic tokens. shape: (batch_size, seq_len)
+        """
+        self._check_encoder()
+        z = self.encoder(feat.to(self.compute_dtype).transpose(1, 2))
+        return self.quantizer.tokenize(z.float())
+
+    @torch.no_grad()
+    def tokenize_global(self, ref_wav: torch.Tensor) -> torch.Tensor:
+        """
+        Tokenizes reference clips into global tokens.
+
+        Args:
+            ref_wav (tensor): Reference clips. shape: (batch_size, wav_len)
+
+        Returns:
+            tensor: Global tokens. shape: (batch_size, 1, global_dim)
+        """
+        self._check_encoder()
+        mel = self.mel_transformer(ref_wav.float()).squeeze(1)
+        mel = mel.to(self.compute_dtype)
+        return self.speaker_encoder.tokenize(mel.transpose(1, 2))
+
+    @torch.no_grad()
+    def detokenize(self, semantic_tokens, global_tokens, window_size: int = None):
         """
         Detokenizes the semantic and global tokens into a waveform.
 
         Args:
             semantic_tokens (tensor): Semantic tokens.
             global_tokens (tensor): Global tokens.
+            window_size (int, optional): Decode longer sequences window by window,
+                see `decode_windowed`.
 
         Returns:
             tensor: Reconstructed waveform.
         """
-        z_q = self.quantizer.detokenize(semantic_tokens)
-        d_vector = self.speaker_encoder.detokenize(global_tokens)
-        x = self.prenet(z_q, d_vector)
+        speaker = self.speaker_conditioning(global_tokens)
+        if window_size is not None:
+            return self.decode_windowed(semantic_tokens, speaker, window_size)
+        return self.decode(semantic_tokens, speaker)
+
+    @torch.no_grad()
+    def speaker_conditioning(self, global_tokens: torch.Tensor) -> SpeakerConditioning:
+        """
+        Computes the speaker conditioning of the decoder, reusing that of recently
+        seen global tokens.
+
+        Both the FSQ lookup and projection of the d-vector and the scale and shift
+        projections of every prenet AdaLayerNorm only depend on the speaker, so
+        they are computed once per speaker and cached by its global tokens.
+
+        Args:
+            global_tokens (tensor): Global tokens. shape: (batch_size, 1, global_dim)
+
+        Returns:
+            SpeakerConditioning: Conditioning of the batch.
+        """
+        device = self.speaker_encoder.project.weight.device
+        conditionings = []
+        for row in global_tokens:
+            key = (tuple(row.reshape(-1).tolist()), str(device), self.compute_dtype)
+            # Weights change during training, so nothing is reused there
+            conditioning = None if self.training else self.speaker_cache.get(key)
+            if conditioning is None:
+                d_vector = self.speaker_encoder.detokenize(row.unsqueeze(0))
+                conditioning = SpeakerConditioning(
+                    d_vector, self.prenet.vocos_backbone.modulations(d_vector)
+                )
+                if not self.training:
+                    self.speaker_cache.put(key, conditioning)
+            conditionings.append(conditioning)
+
+        if len(conditionings) == 1:
+            return conditionings[0]
+        return SpeakerConditioning.cat(conditionings)
+
+    @torch.no_grad()
+    def decode(
+        self,
+        semantic_tokens: torch.Tensor,
+        speaker: Union[torch.Tensor, SpeakerConditioning],
+    ) -> torch.Tensor:
+        """
+        Decodes semantic tokens into a waveform for a given speaker.
+
+        Args:
+            semantic_tokens (tensor): Semantic tokens.
+            speaker (tensor | SpeakerConditioning): Speaker embedding from
+                `SpeakerEncoder.detokenize`, or the conditioning from
+                `speaker_conditioning`.
+
+        Returns:
+            tensor: Reconstructed waveform.
+        """
+        if isinstance(speaker, SpeakerConditioning):
+            d_vector, modulations = speaker
+        else:
+            d_vector, modulations = speaker, None
+
+        z_q = self.quantizer.detokenize(semantic_tokens).to(self.compute_dtype)
+        x = self.prenet(z_q, d_vector, modulations)
         x = x + d_vector.unsqueeze(-1)
         wav_recon = self.decoder(x)
 
-        return wav_recon
+        return wav_recon.float()
+
+    def decode_context(self) -> int:
+        """
+        Returns the number of semantic tokens on either side of a token that its
+        waveform samples depend on, bounded from the convolution kernels of the
+        prenet and the wave generator.
+        """
+        # Context in tokens, and output samples per token at the current layer
+        context, scale = 0.0, 1
+        for module in [*self.prenet.modules(), *self.decoder.modules()]:
+            if isinstance(module, nn.ConvTranspose1d):
+                context += math.ceil(module.kernel_size[0] / module.stride[0]) / scale
+                scale *= module.stride[0]
+            elif isinstance(module, nn.Conv1d):
+                context += (module.kernel_size[0] - 1) * module.dilation[0] / 2 / scale
+        return math.ceil(context)
+
+    @torch.no_grad()
+    def decode_windowed(
+        self,
+        semantic_tokens: torch.Tensor,
+        speaker: Union[torch.Tensor, SpeakerConditioning],
+        window_size: int,
+        context: int = None,
+    ) -> torch.Tensor:
+        """
+        Decodes semantic tokens window by window, so that the activations of the
+        wave generator, and with them the peak memory, do not grow with the
+        sequence length.
+
+        Each window is decoded with `context` tokens of each neighbour, which
+        cover the receptive field of the decoder, and only the audio of its own
+        tokens is kept. The result equals `decode` up to float rounding.
+
+        Args:
+            semantic_tokens (tensor): Semantic tokens.
+            speaker (tensor | SpeakerConditioning): See `decode`.
+            window_size (int): Semantic tokens whose audio one pass produces.
+            context (int, optional): Tokens added on each side of a window.
+                Defaults to `decode_context()`.
+
+        Returns:
+            tensor: Reconstructed waveform.
+        """
+        length = semantic_tokens.shape[-1]
+        if length <= window_size:
+            return self.decode(semantic_tokens, speaker)
+        if context is None:
+            context = self.decode_context()
+
+        wavs = []
+        for start in range(0, length, window_size):
+            end = min(start + window_size, length)
+            left, right = max(0, start - context), min(length, end + context)
+            wav = self.decode(semantic_tokens[:, left:right], speaker)
+            hop_length = wav.shape[-1] // (right - left)
+            wavs.append(wav[..., (start - left) * hop_length : (end - left) * hop_length])
+        return torch.cat(wavs, dim=-1)
+
+    def _check_encoder(self):
+        """Raise if the model was loaded without the modules that encode audio."""
+        if self.encoder is None:
+            raise RuntimeError(
+                "BiCodec was loaded with decode_only=True and cannot encode audio"
+            )
 
     def init_mel_transformer(self, config: Dict[str, Any]):
         """
@@ -245,3 +503,31 @@ if __name__ == "__main__":
         print("Test successful")
     else:
         print("Test failed")
+
+    # Windowed decoding must match decoding the whole sequence, which needs
+    # windows and their context to be shorter than it
+    tolerance = 1e-5
+    long_tokens = torch.randint(0, 8192, (1, 400))
+    long_global_tokens = global_tokens[:1]
+    with torch.no_grad():
+        wav_full = model.detokenize(long_tokens, long_global_tokens)
+        for window_size in [16, 50, 133]:
+            wav_windowed = model.detokenize(long_tokens, long_global_tokens, window_size)
+            error = (wav_windowed - wav_full).abs().max().item()
+            status = "successful" if error < tolerance else "failed"
+            print(
+                f"Windowed test {status}: window_size={window_size}, "
+                f"max error {error:.2e}"
+            )
+
+    # The quantizers must keep the exact fp32 weights under a reduced dtype
+    bf16_model = BiCodec.load_from_checkpoint(
+        model_dir="pretrained_models/SparkTTS-0.5B/BiCodec", dtype=torch.bfloat16
+    )
+    fp32_state = model.state_dict()
+    for name, tensor in bf16_model.state_dict().items():
+        if "quantizer." in name and not torch.equal(tensor, fp32_state[name]):
+            print(f"Test failed: {name} is not bit-identical to the fp32 load")
+            break
+    else:
+        print("Quantizer weights match the fp32 load")
@@ -0,0 +1,189 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import torch
+import inspect
+import tempfile
+import threading
+import torch.nn as nn
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from sparktts.models.bicodec import BiCodec
+from sparktts.utils.cache import hash_bytes
+
+
+# Semantic token lengths (50 tokens = 1s) the decode graph is traced for
+DEFAULT_BUCKETS = (50, 100, 200, 400, 800, 1600)
+
+
+class _DecodeGraph(nn.Module):
+    """Module wrapper of `BiCodec.decode`, so that it can be traced and saved."""
+
+    def __init__(self, model: BiCodec):
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self, semantic_tokens: torch.Tensor, d_vector: torch.Tensor
+    ) -> torch.Tensor:
+        return self.model.decode(semantic_tokens, d_vector)
+
+
+def _code_fingerprint(model: nn.Module) -> str:
+    """Hash of the sparktts source files defining the traced modules, so graphs
+    traced from older code are never loaded after the code changes."""
+    package_dir = Path(__file__).resolve().parents[1]
+    files = set()
+    for module in [_DecodeGraph(model), *model.modules()]:
+        path = inspect.getsourcefile(type(module))
+        if path is not None and Path(path).resolve().is_relative_to(package_dir):
+            files.add(Path(path).resolve())
+    return hash_bytes(*(path.read_bytes() for path in sorted(files)))
+
+
+class CompiledBiCodecDecoder:
+    """BiCodec decoder that runs TorchScript graphs traced for fixed token lengths.
+
+    The speaker d-vector is computed eagerly and cached per speaker (the FSQ
+    code lookup is not traceable and costs little); the semantic tokens are padded to the next
+    bucket length by repeating the last token, decoded by the graph of that
+    (batch size, bucket) pair and trimmed to the true length. Only the last
+    frames within the receptive field of the decoder see the padding. Graphs
+    are traced on first use and, with a `cache_dir`, saved so later processes
+    load them instead of tracing again. Sequences longer than the largest
+    bucket are decoded eagerly.
+    """
+
+    def __init__(
+        self,
+        model: BiCodec,
+        buckets: Tuple[int, ...] = DEFAULT_BUCKETS,
+        cache_dir: Path = None,
+        cache_salt: bytes = b"",
+    ):
+        """
+        Args:
+            model (BiCodec): Loaded model in eval mode, on its target device.
+            buckets (Tuple[int, ...]): Semantic token lengths to trace for.
+            cache_dir (Path, optional): Directory that persists traced graphs.
+            cache_salt (bytes): Identifies the checkpoint and load options, so
+                graphs of other models are never loaded.
+        """
+        self.model = model
+        self.buckets = sorted(buckets)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.cache_salt = cache_salt
+        self.code_fingerprint = _code_fingerprint(model)
+        self.graphs: Dict[Tuple[int, int], torch.jit.ScriptModule] = {}
+        self._lock = threading.Lock()
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def device(self) -> torch.device:
+        return next(self.model.parameters()).device
+
+    def bucket(self, length: int) -> int:
+        """Returns the smallest bucket that fits `length` tokens, or None."""
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return None
+
+    def _cache_path(self, batch_size: int, bucket: int) -> Path:
+        key = hash_bytes(
+            self.cache_salt,
+            self.code_fingerprint.encode(),
+            repr((torch.__version__, self.device.type, batch_size, bucket)).encode(),
+        )
+        return self.cache_dir / f"bicodec_decode_{key}.pt"
+
+    def _trace(self, batch_size: int, bucket: int) -> torch.jit.ScriptModule:
+        """Traces the decode graph of one (batch size, bucket) pair."""
+        semantic_tokens = torch.zeros(
+            batch_size, bucket, dtype=torch.long, device=self.device
+        )
+        d_vector = torch.zeros(
+            batch_size,
+            self.model.speaker_encoder.project.out_features,
+            dtype=self.model.compute_dtype,
+            device=self.device,
+        )
+        with torch.no_grad():
+            graph = torch.jit.trace(
+                _DecodeGraph(self.model), (semantic_tokens, d_vector)
+            )
+        return torch.jit.freeze(graph.eval())
+
+    def _graph(self, batch_size: int, bucket: int) -> torch.jit.ScriptModule:
+        """Returns the graph of one (batch size, bucket) pair, loading or tracing it."""
+        key = (batch_size, bucket)
+        with self._lock:
+            if key in self.graphs:
+                return self.graphs[key]
+
+            path = None
+            if self.cache_dir is not None:
+                path = self._cache_path(batch_size, bucket)
+                if path.exists():
+                    self.graphs[key] = torch.jit.load(path, map_location=self.device)
+                    return self.graphs[key]
+
+            graph = self._trace(batch_size, bucket)
+            if path is not None:
+                # Write to a temporary file first so readers never see partial files
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                os.close(fd)
+                torch.jit.save(graph, tmp_path)
+                os.replace(tmp_path, path)
+
+            self.graphs[key] = graph
+            return graph
+
+    def warmup(self, batch_sizes: List[int] = (1,)):
+        """Loads or traces the graphs of every bucket for the given batch sizes."""
+        for batch_size in batch_sizes:
+            for bucket in self.buckets:
+                self._graph(batch_size, bucket)
+
+    @torch.no_grad()
+    def detokenize(
+        self, semantic_tokens: torch.Tensor, global_tokens: torch.Tensor
+    ) -> torch.Tensor:
+        """Drop-in replacement of `BiCodec.detokenize`.
+
+        Args:
+            semantic_tokens (torch.Tensor): shape: (batch_size, seq_len)
+            global_tokens (torch.Tensor): shape: (batch_size, 1, global_dim)
+
+        Returns:
+            torch.Tensor: Reconstructed waveform. shape: (batch_size, 1, wav_len)
+        """
+        batch_size, length = semantic_tokens.shape
+        bucket = self.bucket(length)
+        if bucket is None or length == 0:
+            return self.model.detokenize(semantic_tokens, global_tokens)
+
+        d_vector = self.model.speaker_conditioning(global_tokens).d_vector
+        padding = semantic_tokens[:, -1:].expand(batch_size, bucket - length)
+        padded = torch.cat([semantic_tokens, padding], dim=1)
+
+        wav = self._graph(batch_size, bucket)(padded, d_vector)
+        hop_length = wav.shape[-1] // bucket
+        return wav[..., : length * hop_length]
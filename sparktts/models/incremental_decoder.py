@@ -0,0 +1,306 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from typing import Callable, List, Optional
+
+from sparktts.models.bicodec import BiCodec
+from sparktts.modules.blocks.layers import ResidualUnit
+from sparktts.modules.blocks.vocos import ConvNeXtBlock, VocosBackbone
+from sparktts.modules.encoder_decoder.wave_generator import DecoderBlock
+
+
+# Every stage maps new frames (batch, channels, time) to the frames of its output
+# that are final, or None while there are none. `final` marks the end of the input.
+
+
+class _Pointwise:
+    """Stage of layers that act on every frame independently."""
+
+    def __init__(self, fn: Callable[[torch.Tensor], torch.Tensor]):
+        self.fn = fn
+
+    def push(self, x: Optional[torch.Tensor], final: bool) -> Optional[torch.Tensor]:
+        return None if x is None else self.fn(x)
+
+
+class _Conv1d:
+    """Stage of a "same" padded Conv1d that keeps the input its next outputs need."""
+
+    def __init__(self, conv: nn.Conv1d):
+        self.conv = conv
+        self.padding = conv.padding[0]
+        self.span = (conv.kernel_size[0] - 1) * conv.dilation[0] + 1
+        if conv.stride[0] != 1 or 2 * self.padding != self.span - 1:
+            raise ValueError("only stride 1 'same' convolutions stream")
+        self.buffer = None
+
+    def push(self, x: Optional[torch.Tensor], final: bool) -> Optional[torch.Tensor]:
+        if x is not None:
+            if self.buffer is None:
+                # The zero padding of the sequence start
+                self.buffer = F.pad(x, (self.padding, 0))
+            else:
+                self.buffer = torch.cat([self.buffer, x], dim=-1)
+        if self.buffer is None:
+            return None
+        if final:
+            self.buffer = F.pad(self.buffer, (0, self.padding))
+        if self.buffer.shape[-1] < self.span:
+            return None
+
+        y = F.conv1d(
+            self.buffer,
+            self.conv.weight,
+            self.conv.bias,
+            dilation=self.conv.dilation,
+            groups=self.conv.groups,
+        )
+        self.buffer = self.buffer[..., y.shape[-1] :]
+        return y
+
+
+class _ConvTranspose1d:
+    """Stage of a ConvTranspose1d that keeps the inputs its next outputs need.
+
+    Input frame i adds to the uncropped outputs [i * stride, i * stride + kernel),
+    so once n frames are in, the outputs before n * stride are final.
+    """
+
+    def __init__(self, conv: nn.ConvTranspose1d):
+        self.conv = conv
+        self.stride = conv.stride[0]
+        self.kernel_size = conv.kernel_size[0]
+        self.padding = conv.padding[0]
+        if conv.dilation[0] != 1 or conv.output_padding[0] != 0:
+            raise ValueError("dilated or output padded transposed convs")
+        self.buffer = None
+        # Absolute index of the first buffered input and of the next uncropped output
+        self.buffer_start = 0
+        self.emitted = self.padding
+
+    def push(self, x: Optional[torch.Tensor], final: bool) -> Optional[torch.Tensor]:
+        if x is not None:
+            self.buffer = x if self.buffer is None else torch.cat([self.buffer, x], -1)
+        if self.buffer is None:
+            return None
+
+        num_inputs = self.buffer_start + self.buffer.shape[-1]
+        if final:
+            end = (num_inputs - 1) * self.stride + self.kernel_size - self.padding
+        else:
+            end = num_inputs * self.stride
+        if end <= self.emitted:
+            return None
+
+        y = F.conv_transpose1d(
+            self.buffer,
+            self.conv.weight,
+            self.conv.bias,
+            stride=self.stride,
+            groups=self.conv.groups,
+        )
+        offset = self.buffer_start * self.stride
+        y = y[..., self.emitted - offset : end - offset]
+        self.emitted = end
+
+        # Keep the inputs that add to output `end` and later
+        first_input = max(0, (end - self.kernel_size) // self.stride + 1)
+        self.buffer = self.buffer[..., first_input - self.buffer_start :]
+        self.buffer_start = first_input
+        return y
+
+
+class _Sequential:
+    def __init__(self, stages: List):
+        self.stages = stages
+
+    def push(self, x: Optional[torch.Tensor], final: bool) -> Optional[torch.Tensor]:
+        for stage in self.stages:
+            x = stage.push(x, final)
+        return x
+
+
+class _Residual:
+    """Stage of `x + inner(x)`, which holds `x` back until `inner` catches up."""
+
+    def __init__(self, inner: _Sequential):
+        self.inner = inner
+        self.queue = None
+
+    def push(self, x: Optional[torch.Tensor], final: bool) -> Optional[torch.Tensor]:
+        if x is not None:
+            self.queue = x if self.queue is None else torch.cat([self.queue, x], -1)
+        y = self.inner.push(x, final)
+        if y is None:
+            return None
+        length = y.shape[-1]
+        residual, self.queue = self.queue[..., :length], self.queue[..., length:]
+        return residual + y
+
+
+def _stream(module: nn.Module):
+    """Stage of a WaveGenerator module."""
+    if isinstance(module, nn.Sequential):
+        return _Sequential([_stream(child) for child in module])
+    if isinstance(module, DecoderBlock):
+        return _stream(module.block)
+    if isinstance(module, ResidualUnit):
+        return _Residual(_stream(module.block))
+    if isinstance(module, nn.ConvTranspose1d):
+        return _ConvTranspose1d(module)
+    if isinstance(module, nn.Conv1d):
+        return _Conv1d(module)
+    # Snake1d and Tanh
+    return _Pointwise(module)
+
+
+def _stream_backbone(backbone: VocosBackbone, modulations: List = None) -> List:
+    """Stages of `VocosBackbone.forward`, without the final (B, C, T) -> (B, T, C)."""
+    if modulations is None:
+        modulations = [None] * (len(backbone.convnext) + 1)
+    if backbone.adanorm:
+        norm = lambda x: backbone.norm(x.transpose(1, 2), None, modulations[0])
+    else:
+        norm = lambda x: backbone.norm(x.transpose(1, 2))
+
+    stages = [_Conv1d(backbone.embed), _Pointwise(lambda x: norm(x).transpose(1, 2))]
+    for block, modulation in zip(backbone.convnext, modulations[1:]):
+        stages.append(_convnext(block, modulation))
+    stages.append(
+        _Pointwise(lambda x: backbone.final_layer_norm(x.transpose(1, 2)).transpose(1, 2))
+    )
+    return stages
+
+
+def _convnext(block: ConvNeXtBlock, modulation) -> _Residual:
+    return _Residual(
+        _Sequential(
+            [
+                _Conv1d(block.dwconv),
+                _Pointwise(lambda x: block.pointwise(x, None, modulation)),
+            ]
+        )
+    )
+
+
+class IncrementalBiCodecDecoder:
+    """Decodes the semantic tokens of one stream as they arrive, vocoding each once.
+
+    Every convolution of the prenet and the wave generator keeps the input its
+    next outputs need, so `push` only computes new audio and the result equals
+    `BiCodec.detokenize` of the whole sequence up to float rounding. The kernels
+    are not causal: the audio of a token is final, and returned, once
+    `BiCodec.decode_context()` more tokens have been pushed; `flush` returns
+    the rest at the end of the stream.
+    """
+
+    def __init__(self, model: BiCodec, global_tokens: torch.Tensor):
+        """
+        Args:
+            model (BiCodec): Loaded model in eval mode.
+            global_tokens (torch.Tensor): Global tokens of the speaker.
+                shape: (batch_size, 1, global_dim)
+        """
+        for sampling, _ in model.prenet.downsample:
+            if sampling.upsample_scale != 1 or sampling.downsample_scale != 1:
+                raise ValueError("prenets that resample do not stream")
+
+        self.model = model
+        self.lookahead = model.decode_context()
+        d_vector, modulations = model.speaker_conditioning(global_tokens)
+
+        # Stages pass (B, C, T) on, where `Decoder.forward` alternates layouts
+        prenet = model.prenet
+        stages = [
+            _Pointwise(lambda x: prenet.linear_pre(x.transpose(1, 2)).transpose(1, 2))
+        ]
+        for sampling, backbone in prenet.downsample:
+            # Sampling blocks of ratio 1 act per frame, taking (B, T, C)
+            stages.append(
+                _Pointwise(lambda x, sampling=sampling: sampling(x.transpose(1, 2)))
+            )
+            stages += _stream_backbone(backbone)
+        stages += _stream_backbone(prenet.vocos_backbone, modulations)
+        stages.append(_Pointwise(lambda x: prenet.linear(x.transpose(1, 2)).transpose(1, 2)))
+        if prenet.use_tanh_at_final:
+            stages.append(_Pointwise(torch.tanh))
+        stages.append(_Pointwise(lambda x: x + d_vector.unsqueeze(-1)))
+        stages.append(_stream(model.decoder.model))
+        self.pipeline = _Sequential(stages)
+        self.batch_size = global_tokens.shape[0]
+        self.finished = False
+
+    @torch.no_grad()
+    def push(self, semantic_tokens: torch.Tensor) -> torch.Tensor:
+        """Decodes the next semantic tokens.
+
+        Args:
+            semantic_tokens (torch.Tensor): shape: (batch_size, new_tokens)
+
+        Returns:
+            torch.Tensor: The audio that became final. shape: (batch_size, 1, samples)
+        """
+        assert not self.finished, "push after flush"
+        x = None
+        if semantic_tokens.shape[-1] > 0:
+            x = self.model.quantizer.detokenize(semantic_tokens)
+            x = x.to(self.model.compute_dtype)
+        return self._output(self.pipeline.push(x, final=False))
+
+    @torch.no_grad()
+    def flush(self) -> torch.Tensor:
+        """Returns the remaining audio, the end of the stream being reached."""
+        self.finished = True
+        return self._output(self.pipeline.push(None, final=True))
+
+    def _output(self, wav: Optional[torch.Tensor]) -> torch.Tensor:
+        if wav is None:
+            device = self.model.speaker_encoder.project.weight.device
+            return torch.zeros(self.batch_size, 1, 0, device=device)
+        return wav.float()
+
+
+# Test the decoder
+if __name__ == "__main__":
+
+    model = BiCodec.load_from_checkpoint(
+        model_dir="pretrained_models/SparkTTS-0.5B/BiCodec", decode_only=True
+    )
+
+    global_tokens = torch.randint(0, 4096, (1, 1, 32))
+    semantic_tokens = torch.randint(0, 8192, (1, 120))
+    with torch.no_grad():
+        wav = model.detokenize(semantic_tokens, global_tokens)
+
+    # Pushing the tokens in any chunking must match decoding them at once
+    tolerance = 1e-5
+    for chunk_sizes in [[1], [7], [16, 3, 50]]:
+        decoder = IncrementalBiCodecDecoder(model, global_tokens)
+        wavs, start, i = [], 0, 0
+        while start < semantic_tokens.shape[-1]:
+            end = start + chunk_sizes[i % len(chunk_sizes)]
+            wavs.append(decoder.push(semantic_tokens[:, start:end]))
+            start, i = end, i + 1
+        wavs.append(decoder.flush())
+        wav_incremental = torch.cat(wavs, dim=-1)
+
+        assert wav_incremental.shape == wav.shape
+        error = (wav_incremental - wav).abs().max().item()
+        status = "successful" if error < tolerance else "failed"
+        print(f"Test {status}: chunk sizes {chunk_sizes}, max error {error:.2e}")
@@ -0,0 +1,135 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    ONNX export of `BiCodec.detokenize` and an ONNX Runtime decoder for it.
+
+    `OnnxBiCodecDecoder` only depends on numpy and onnxruntime, so vocoder-only
+    workers do not need PyTorch; torch is imported by the exporter alone.
+"""
+
+import numpy as np
+
+from pathlib import Path
+from typing import List
+
+
+INPUT_NAMES = ["semantic_tokens", "global_tokens"]
+OUTPUT_NAMES = ["waveform"]
+
+
+def export_bicodec_decoder(
+    model_dir: Path, output_path: Path, opset_version: int = 17
+) -> Path:
+    """Export the speaker detokenizer, prenet and wave generator of BiCodec to ONNX.
+
+    The graph maps semantic tokens (batch, time) and global tokens (batch, 32),
+    both int64, to a waveform (batch, samples); batch and time are dynamic.
+
+    Args:
+        model_dir (Path): Directory of the BiCodec checkpoint and config.
+        output_path (Path): Path of the written .onnx file.
+        opset_version (int): ONNX opset of the exported graph.
+
+    Returns:
+        Path: `output_path`.
+    """
+    import torch
+    from sparktts.models.bicodec import BiCodec
+
+    class DetokenizeGraph(torch.nn.Module):
+        def __init__(self, model: BiCodec):
+            super().__init__()
+            self.model = model
+
+        def forward(self, semantic_tokens, global_tokens):
+            # The speaker cache of `detokenize` is Python state and not traceable
+            d_vector = self.model.speaker_encoder.detokenize(global_tokens.unsqueeze(1))
+            return self.model.decode(semantic_tokens, d_vector).squeeze(1)
+
+    model = BiCodec.load_from_checkpoint(model_dir, decode_only=True)
+    semantic_tokens = torch.zeros(1, 50, dtype=torch.long)
+    global_tokens = torch.zeros(1, 32, dtype=torch.long)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            DetokenizeGraph(model),
+            (semantic_tokens, global_tokens),
+            str(output_path),
+            input_names=INPUT_NAMES,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes={
+                "semantic_tokens": {0: "batch", 1: "time"},
+                "global_tokens": {0: "batch"},
+                "waveform": {0: "batch", 1: "samples"},
+            },
+            opset_version=opset_version,
+            # the TorchScript based exporter, which inlines the scripted Snake
+            dynamo=False,
+        )
+    return Path(output_path)
+
+
+class OnnxBiCodecDecoder:
+    """Drop-in replacement of `BiCodec.detokenize` running an exported graph."""
+
+    def __init__(
+        self,
+        model_path: Path,
+        providers: List[str] = None,
+        num_threads: int = None,
+    ):
+        """
+        Args:
+            model_path (Path): Path of the graph written by `export_bicodec_decoder`.
+            providers (List[str], optional): ONNX Runtime execution providers.
+                Defaults to the CPU provider.
+            num_threads (int, optional): Intra-op threads of the CPU provider.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=providers or ["CPUExecutionProvider"],
+        )
+
+    def detokenize(
+        self, semantic_tokens: np.ndarray, global_tokens: np.ndarray
+    ) -> np.ndarray:
+        """Decode tokens into waveforms.
+
+        Args:
+            semantic_tokens (np.ndarray): shape: (batch_size, seq_len)
+            global_tokens (np.ndarray): shape: (batch_size, 1, global_dim) as for
+                `BiCodec.detokenize`, or (batch_size, global_dim)
+
+        Returns:
+            np.ndarray: Reconstructed waveform. shape: (batch_size, 1, wav_len)
+        """
+        semantic_tokens = np.asarray(semantic_tokens, dtype=np.int64)
+        global_tokens = np.asarray(global_tokens, dtype=np.int64)
+        global_tokens = global_tokens.reshape(len(semantic_tokens), -1)
+
+        (wav,) = self.session.run(
+            OUTPUT_NAMES,
+            dict(zip(INPUT_NAMES, (semantic_tokens, global_tokens))),
+        )
+        return wav[:, None]
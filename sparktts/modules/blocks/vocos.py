@@ -17,7 +17,7 @@
 import torch
 import torch.nn as nn
 
-from typing import Tuple
+from typing import List, Tuple
 from torch.nn.utils import weight_norm, remove_weight_norm
 
 from typing import Optional
@@ -63,14 +63,24 @@ class ConvNeXtBlock(nn.Module):
         )
 
     def forward(
-        self, x: torch.Tensor, cond_embedding_id: Optional[torch.Tensor] = None
+        self,
+        x: torch.Tensor,
+        cond_embedding_id: Optional[torch.Tensor] = None,
+        modulation: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        return x + self.pointwise(self.dwconv(x), cond_embedding_id, modulation)
+
+    def pointwise(
+        self,
+        x: torch.Tensor,
+        cond_embedding_id: Optional[torch.Tensor] = None,
+        modulation: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
     ) -> torch.Tensor:
-        residual = x
-        x = self.dwconv(x)
+        """The layers after `dwconv`, which act on every frame independently."""
         x = x.transpose(1, 2)  # (B, C, T) -> (B, T, C)
         if self.adanorm:
-            assert cond_embedding_id is not None
-            x = self.norm(x, cond_embedding_id)
+            assert cond_embedding_id is not None or modulation is not None
+            x = self.norm(x, cond_embedding_id, modulation)
         else:
             x = self.norm(x)
         x = self.pwconv1(x)
@@ -79,8 +89,6 @@ class ConvNeXtBlock(nn.Module):
         if self.gamma is not None:
             x = self.gamma * x
         x = x.transpose(1, 2)  # (B, T, C) -> (B, C, T)
-
-        x = residual + x
         return x
 
 
@@ -102,9 +110,21 @@ class AdaLayerNorm(nn.Module):
         torch.nn.init.ones_(self.scale.weight)
         torch.nn.init.zeros_(self.shift.weight)
 
-    def forward(self, x: torch.Tensor, cond_embedding: torch.Tensor) -> torch.Tensor:
-        scale = self.scale(cond_embedding)
-        shift = self.shift(cond_embedding)
+    def modulation(
+        self, cond_embedding: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Scale and shift for a condition, which can be computed once and reused."""
+        return self.scale(cond_embedding), self.shift(cond_embedding)
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        cond_embedding: Optional[torch.Tensor] = None,
+        modulation: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        if modulation is None:
+            modulation = self.modulation(cond_embedding)
+        scale, shift = modulation
         x = nn.functional.layer_norm(x, (self.dim,), eps=self.eps)
         x = x * scale.unsqueeze(1) + shift.unsqueeze(1)
         return x
@@ -321,16 +341,39 @@ class VocosBackbone(Backbone):
             nn.init.trunc_normal_(m.weight, std=0.02)
             nn.init.constant_(m.bias, 0)
 
-    def forward(self, x: torch.Tensor, condition: torch.Tensor = None) -> torch.Tensor:
+    def modulations(
+        self, condition: torch.Tensor
+    ) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """Scale and shift of every AdaLayerNorm for `condition`, in forward order."""
+        assert self.adanorm
+        return [self.norm.modulation(condition)] + [
+            conv_block.norm.modulation(condition) for conv_block in self.convnext
+        ]
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        condition: torch.Tensor = None,
+        modulations: List[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        """
+        Args:
+            x (torch.Tensor): shape (B, C, L)
+            condition (torch.Tensor, optional): AdaLayerNorm condition. shape (B, D)
+            modulations (List, optional): Precomputed `modulations(condition)`,
+                used instead of `condition`.
+        """
+        if modulations is None:
+            modulations = [None] * (len(self.convnext) + 1)
         x = self.embed(x)
         if self.adanorm:
-            assert condition is not None
-            x = self.norm(x.transpose(1, 2), condition)
+            assert condition is not None or modulations[0] is not None
+            x = self.norm(x.transpose(1, 2), condition, modulations[0])
         else:
             x = self.norm(x.transpose(1, 2))
         x = x.transpose(1, 2)
-        for conv_block in self.convnext:
-            x = conv_block(x, condition)
+        for conv_block, modulation in zip(self.convnext, modulations[1:]):
+            x = conv_block(x, condition, modulation)
         x = self.final_layer_norm(x.transpose(1, 2))
         return x
 
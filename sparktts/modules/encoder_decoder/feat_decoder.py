@@ -17,7 +17,7 @@
 import torch
 import torch.nn as nn
 
-from typing import List
+from typing import List, Tuple
 
 from sparktts.modules.blocks.vocos import VocosBackbone
 from sparktts.modules.blocks.samper import SamplingBlock
@@ -75,18 +75,26 @@ class Decoder(nn.Module):
         self.linear = nn.Linear(vocos_dim, out_channels)
         self.use_tanh_at_final = use_tanh_at_final
 
-    def forward(self, x: torch.Tensor, c: torch.Tensor = None):
+    def forward(
+        self,
+        x: torch.Tensor,
+        c: torch.Tensor = None,
+        modulations: List[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ):
         """encoder forward.
 
         Args:
             x (torch.Tensor): (batch_size, input_channels, length)
+            c (torch.Tensor, optional): condition. (batch_size, condition_dim)
+            modulations (List, optional): `vocos_backbone.modulations(c)`, computed
+                ahead to skip the condition projections.
 
         Returns:
             x (torch.Tensor): (batch_size, encode_channels, length)
         """
         x = self.linear_pre(x.transpose(1, 2))
         x = self.downsample(x).transpose(1, 2)
-        x = self.vocos_backbone(x, condition=c)
+        x = self.vocos_backbone(x, condition=c, modulations=modulations)
         x = self.linear(x).transpose(1, 2)
         if self.use_tanh_at_final:
             x = torch.tanh(x)
@@ -10,12 +10,15 @@ from typing import List, Tuple
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.nn import Module
 from torch import Tensor, int32
 from torch.amp import autocast
 
 from einops import rearrange, pack, unpack
 
+from sparktts.utils.cache import tensors_key
+
 # helper functions
 
 
@@ -81,6 +84,14 @@ class FSQ(Module):
         _basis = torch.cumprod(torch.tensor([1] + levels[:-1]), dim=0, dtype=int32)
         self.register_buffer("_basis", _basis, persistent=False)
 
+        # codes_to_indices as one matrix-vector product:
+        # sum((zhat * half_width + half_width) * basis) = zhat @ weights + offset
+        half_width = _levels // 2
+        self.register_buffer(
+            "_index_weights", (half_width * _basis).float(), persistent=False
+        )
+        self._index_offset = (half_width * _basis).sum().item()
+
         self.scale = scale
 
         codebook_dim = len(levels)
@@ -123,6 +134,10 @@ class FSQ(Module):
         self.allowed_dtypes = allowed_dtypes
         self.force_quantization_f32 = force_quantization_f32
 
+        # `project_out` of the implicit codebook, see `output_table`
+        self._output_table = None
+        self._output_table_key = None
+
     def bound(self, z, eps: float = 1e-3):
         """Bound `z`, an array of shape (..., d)."""
         half_l = (self._levels - 1) * (1 + eps) / 2
@@ -152,8 +167,26 @@ class FSQ(Module):
     def codes_to_indices(self, zhat):
         """Converts a `code` to an index in the codebook."""
         assert zhat.shape[-1] == self.codebook_dim
-        zhat = self._scale_and_shift(zhat)
-        return (zhat * self._basis).sum(dim=-1).to(int32)
+        indices = zhat @ self._index_weights.to(zhat.dtype) + self._index_offset
+        return indices.round().to(int32)
+
+    def output_table(self) -> Tensor:
+        """`indices_to_codes` of every index, (codebook_size, dim).
+
+        Built from the implicit codebook on first use and rebuilt when the
+        projection changes.
+        """
+        assert self.return_indices and not self.keep_num_codebooks_dim
+        params = list(self.project_out.parameters())
+        key = tensors_key(self.implicit_codebook, *params)
+        if key != self._output_table_key:
+            with torch.no_grad():
+                codebook = self.implicit_codebook
+                if params:
+                    codebook = codebook.to(params[0].dtype)
+                self._output_table = self.project_out(codebook)
+            self._output_table_key = key
+        return self._output_table
 
     def indices_to_level_indices(self, indices):
         """Converts indices to indices at each level, perhaps needed for a transformer with factorized embeddings"""
@@ -167,6 +200,17 @@ class FSQ(Module):
 
         is_img_or_video = indices.ndim >= (3 + int(self.keep_num_codebooks_dim))
 
+        if (
+            not self.training
+            and self.return_indices
+            and not self.keep_num_codebooks_dim
+        ):
+            # A single gather from the projected codebook
+            codes = F.embedding(indices.long(), self.output_table())
+            if is_img_or_video or self.channel_first:
+                codes = codes.movedim(-1, 1)
+            return codes
+
         codes = self._indices_to_codes(indices)
 
         if self.keep_num_codebooks_dim:
@@ -7,10 +7,10 @@ from typing import List
 from torch import nn
 from torch.nn import Module
 from torch.amp import autocast
-from einx import get_at
 from einops import rearrange, reduce, pack, unpack
 
 from sparktts.modules.fsq.finite_scalar_quantization import FSQ
+from sparktts.utils.cache import tensors_key
 
 
 def exists(val):
@@ -103,6 +103,10 @@ class ResidualFSQ(Module):
         self.quantize_dropout_cutoff_index = quantize_dropout_cutoff_index
         self.quantize_dropout_multiple_of = quantize_dropout_multiple_of  # encodec paper proposes structured dropout, believe this was set to 4
 
+        # Projected codes of every quantizer, see `output_tables`
+        self._output_tables = None
+        self._output_tables_key = None
+
     @property
     def codebooks(self):
         codebooks = [layer.implicit_codebook for layer in self.layers]
@@ -133,7 +137,10 @@ class ResidualFSQ(Module):
             mask, 0
         )  # have it fetch a dummy code to be masked out later
 
-        all_codes = get_at("q [c] d, b n q -> q b n d", self.codebooks, indices)
+        # plain advanced indexing, which unlike einx.get_at can be traced and exported
+        quantizer_range = torch.arange(self.num_quantizers, device=indices.device)
+        all_codes = self.codebooks[quantizer_range, indices]
+        all_codes = rearrange(all_codes, "b n q d -> q b n d")
 
         # mask out any codes that were dropout-ed
 
@@ -150,10 +157,46 @@ class ResidualFSQ(Module):
 
         return all_codes
 
+    def output_tables(self) -> torch.Tensor:
+        """Contribution of every index of every quantizer to the output,
+        (num_quantizers, codebook_size, dim).
+
+        `project_out` is linear, so the output of indices is the sum of one row
+        per quantizer; the bias is folded into the table of the first quantizer,
+        which quantizer dropout never drops. Rebuilt when the weights change.
+        """
+        params = list(self.project_out.parameters())
+        key = tensors_key(self.scales, *params)
+        if key != self._output_tables_key:
+            with torch.no_grad():
+                codes = self.codebooks * self.scales.unsqueeze(1)
+                if self.has_projections:
+                    codes = codes.to(self.project_out.weight.dtype)
+                    tables = codes @ self.project_out.weight.t()
+                    if self.project_out.bias is not None:
+                        tables[0] += self.project_out.bias
+                else:
+                    tables = codes
+            self._output_tables = tables
+            self._output_tables_key = key
+        return self._output_tables
+
     def get_output_from_indices(self, indices):
-        codes = self.get_codes_from_indices(indices)
-        codes_summed = reduce(codes, "q ... -> ...", "sum")
-        return self.project_out(codes_summed)
+        if self.training or indices.shape[-1] != self.num_quantizers:
+            codes = self.get_codes_from_indices(indices)
+            codes_summed = reduce(codes, "q ... -> ...", "sum")
+            return self.project_out(codes_summed)
+
+        tables = self.output_tables()
+        output = 0.0
+        for quantizer_index in range(self.num_quantizers):
+            quantizer_indices = indices[..., quantizer_index]
+            codes = F.embedding(quantizer_indices.clamp(min=0), tables[quantizer_index])
+            if self.quantize_dropout:
+                # Indices of dropped quantizers are -1
+                codes = codes.masked_fill((quantizer_indices == -1).unsqueeze(-1), 0.0)
+            output = output + codes
+        return output
 
     def forward(self, x, return_all_codes=False, rand_quantize_dropout_fixed_seed=None):
         num_quant, quant_dropout_multiple_of, device = (
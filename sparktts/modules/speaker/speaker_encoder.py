@@ -36,6 +36,8 @@ class SpeakerEncoder(nn.Module):
         token_num (int): sequence length of speaker tokens
         fsq_levels (List[int]): number of levels for each quantizer
         fsq_num_quantizers (int): number of quantizers
+        decode_only (bool): skip the ECAPA-TDNN and perceiver, which are only needed to
+            tokenize mel spectrograms, for models that only detokenize
 
     Return:
         speaker_embs: (B, T2, out_dim)
@@ -49,15 +51,20 @@ class SpeakerEncoder(nn.Module):
         token_num: int = 32,
         fsq_levels: List[int] = [4, 4, 4, 4, 4, 4],
         fsq_num_quantizers: int = 1,
+        decode_only: bool = False,
     ):
         super(SpeakerEncoder, self).__init__()
 
-        self.speaker_encoder = ECAPA_TDNN_GLOB_c512(
-            feat_dim=input_dim, embed_dim=out_dim
-        )
-        self.perceiver_sampler = PerceiverResampler(
-            dim=latent_dim, dim_context=512 * 3, num_latents=token_num
-        )
+        if decode_only:
+            self.speaker_encoder = None
+            self.perceiver_sampler = None
+        else:
+            self.speaker_encoder = ECAPA_TDNN_GLOB_c512(
+                feat_dim=input_dim, embed_dim=out_dim
+            )
+            self.perceiver_sampler = PerceiverResampler(
+                dim=latent_dim, dim_context=512 * 3, num_latents=token_num
+            )
         self.quantizer = ResidualFSQ(
             levels=fsq_levels,
             num_quantizers=fsq_num_quantizers,
@@ -101,14 +108,15 @@ class SpeakerEncoder(nn.Module):
         """tokenize the input mel spectrogram"""
         _, features = self.speaker_encoder(mels, True)
         x = self.perceiver_sampler(features.transpose(1, 2)).transpose(1, 2)
-        zq, indices = self.quantizer(x)
+        # the quantizer may be kept in fp32 when the encoder runs in lower precision
+        zq, indices = self.quantizer(x.to(self.quantizer.scales.dtype))
         return indices
     
     def detokenize(self, indices: torch.Tensor) -> torch.Tensor:
         """detokenize the input indices to d-vector"""
         zq = self.quantizer.get_output_from_indices(indices.transpose(1, 2)).transpose(1, 2)
         x = zq.reshape(zq.shape[0], -1)
-        d_vector = self.project(x)
+        d_vector = self.project(x.to(self.project.weight.dtype))
         return d_vector
 
 if __name__ == "__main__":
@@ -24,6 +24,8 @@ import torch.nn.functional as F
 from einops import rearrange
 from torch.nn.utils import weight_norm
 
+from sparktts.utils.cache import tensors_key
+
 
 def WNConv1d(*args, **kwargs):
     return weight_norm(nn.Conv1d(*args, **kwargs))
@@ -44,6 +46,7 @@ class FactorizedVectorQuantize(nn.Module):
         decay: float = 0.99,
         threshold_ema_dead_code: float = 2,
         momentum: float = 0.99,
+        decode_only: bool = False,
         **kwargs,
     ):
         super().__init__()
@@ -57,7 +60,12 @@ class FactorizedVectorQuantize(nn.Module):
         self.momentum = momentum
 
         if input_dim != self.codebook_dim:
-            self.in_project = WNConv1d(input_dim, self.codebook_dim, kernel_size=1)
+            # in_project only maps encoder latents, decode-only models skip it
+            self.in_project = (
+                None
+                if decode_only
+                else WNConv1d(input_dim, self.codebook_dim, kernel_size=1)
+            )
             self.out_project = WNConv1d(self.codebook_dim, input_dim, kernel_size=1)
 
         else:
@@ -67,6 +75,10 @@ class FactorizedVectorQuantize(nn.Module):
         self.codebook = nn.Embedding(self.codebook_size, self.codebook_dim)
         self.register_buffer("cluster_size", torch.zeros(self.codebook_size))
 
+        # L2 normalized codebook of the nearest code search, see `normalized_codebook`
+        self._normalized_codebook = None
+        self._normalized_codebook_key = None
+
     def forward(self, z: torch.Tensor) -> Dict[str, Any]:
         """Quantized the input tensor using a fixed codebook and returns
         the corresponding codebook vectors
@@ -148,8 +160,10 @@ class FactorizedVectorQuantize(nn.Module):
     def tokenize(self, z: torch.Tensor) -> torch.Tensor:
         """tokenize the input tensor"""
         z_e = self.in_project(z)
-        _, indices, _ = self.decode_latents(z_e)
-        return indices
+        if self.training:
+            _, indices, _ = self.decode_latents(z_e)
+            return indices
+        return self.nearest_codes(z_e)
 
     def detokenize(self, indices):
         """detokenize the input indices"""
@@ -166,6 +180,41 @@ class FactorizedVectorQuantize(nn.Module):
     def decode_code(self, embed_id):
         return self.embed_code(embed_id).transpose(1, 2)
 
+    def normalized_codebook(self) -> torch.Tensor:
+        """L2 normalized codebook, recomputed only when the codebook changes."""
+        key = tensors_key(self.codebook.weight)
+        if key != self._normalized_codebook_key:
+            with torch.no_grad():
+                self._normalized_codebook = F.normalize(self.codebook.weight)
+            self._normalized_codebook_key = key
+        return self._normalized_codebook
+
+    @torch.no_grad()
+    def nearest_codes(self, latents: torch.Tensor, chunk_size: int = 1024) -> torch.Tensor:
+        """Indices of the codes nearest to the latents, as found by `decode_latents`.
+
+        With both sides L2 normalized, the nearest code is the one of largest
+        dot product, so the norm terms of the distance are skipped. The frames
+        are searched `chunk_size` at a time, which bounds the similarity matrix
+        to chunk_size x codebook_size.
+
+        Args:
+            latents (Tensor): shape: (B, D, T)
+            chunk_size (int): number of frames searched at a time
+
+        Returns:
+            Tensor: indices. shape: (B, T)
+        """
+        encodings = latents.transpose(1, 2).reshape(-1, latents.shape[1])
+        codebook_t = self.normalized_codebook().t()
+        indices = torch.cat(
+            [
+                (F.normalize(chunk) @ codebook_t).argmax(dim=1)
+                for chunk in encodings.split(chunk_size)
+            ]
+        )
+        return indices.reshape(latents.shape[0], latents.shape[2])
+
     def decode_latents(self, latents):
         encodings = rearrange(latents, "b d t -> (b t) d")
         codebook = self.codebook.weight
@@ -18,7 +18,9 @@ Description:
     audio processing.
 """
 
+import os
 import random
+import struct
 import soxr
 import soundfile
 import torch
@@ -26,8 +28,23 @@ import torchaudio
 import numpy as np
 
 from pathlib import Path
-from typing import Tuple
-from numpy.lib.stride_tricks import sliding_window_view
+from typing import Iterable, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sparktts.utils.cache import LRUCache
+
+
+# WAV sample formats read through a memory map: (format tag, bits) -> dtype, scale
+# to [-1, 1) as applied by soundfile. Other formats are decoded by soundfile.
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+MMAP_WAV_FORMATS = {
+    (WAVE_FORMAT_PCM, 16): (np.dtype("<i2"), 1.0 / 2**15),
+    (WAVE_FORMAT_PCM, 32): (np.dtype("<i4"), 1.0 / 2**31),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): (np.dtype("<f4"), None),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): (np.dtype("<f8"), None),
+}
 
 
 def audio_volume_normalize(audio: np.ndarray, coeff: float = 0.2) -> np.ndarray:
@@ -73,12 +90,90 @@ def audio_volume_normalize(audio: np.ndarray, coeff: float = 0.2) -> np.ndarray:
     return audio
 
 
+def _wav_layout(adfile: Path):
+    """Locate the samples of a WAV file that can be memory mapped.
+
+    Returns:
+        (data offset, dtype, scale, channels, sample rate, frames), or None when
+        the file is not a WAV file of a format in `MMAP_WAV_FORMATS`.
+    """
+    with open(adfile, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"data":
+                break
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                f.seek(chunk_size & 1, os.SEEK_CUR)
+            else:
+                # Chunks are padded to an even size
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+        offset = f.tell()
+
+    if fmt is None or len(fmt) < 16:
+        return None
+    format_tag, channels, sr, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # The format tag is the first field of the sub-format GUID
+        (format_tag,) = struct.unpack("<H", fmt[24:26])
+    if (format_tag, bits) not in MMAP_WAV_FORMATS or channels == 0:
+        return None
+    dtype, scale = MMAP_WAV_FORMATS[(format_tag, bits)]
+    if block_align != channels * dtype.itemsize:
+        return None
+
+    # Streamed files may leave the data size unset; the samples run to the end
+    data_size = min(chunk_size, os.path.getsize(adfile) - offset)
+    frames = data_size // block_align
+    if frames == 0:
+        return None
+    return offset, dtype, scale, channels, sr, frames
+
+
+def read_audio(adfile: Path) -> Tuple[np.ndarray, int]:
+    """Read the first channel of an audio file as float64 samples in [-1, 1].
+
+    PCM and float WAV files are memory mapped and only the first channel is
+    converted, with the same scaling as soundfile; no decode buffer of the
+    whole file is allocated. Other files are decoded by soundfile.
+
+    Args:
+        adfile (Path): path to audio file.
+
+    Returns:
+        audio (np.ndarray): samples of the first channel.
+        sr (int): sampling rate of the file.
+    """
+    layout = _wav_layout(adfile)
+    if layout is None:
+        audio, sr = soundfile.read(adfile)
+        if len(audio.shape) > 1:
+            audio = audio[:, 0]
+        return audio, sr
+
+    offset, dtype, scale, channels, sr, frames = layout
+    samples = np.memmap(
+        adfile, dtype=dtype, mode="r", offset=offset, shape=(frames, channels)
+    )[:, 0]
+    if scale is None:
+        return samples.astype(np.float64), sr
+    return np.multiply(samples, scale, dtype=np.float64), sr
+
+
 def load_audio(
     adfile: Path,
     sampling_rate: int = None,
     length: int = None,
     volume_normalize: bool = False,
     segment_duration: int = None,
+    resample_quality: str = "VHQ",
 ) -> np.ndarray:
     r"""Load audio file with target sampling rate and lsength
 
@@ -89,17 +184,17 @@ def load_audio(
         volume_normalize (bool, optional): whether perform volume normalization. Defaults to False.
         segment_duration (int): random select a segment with duration of {segment_duration}s.
                                 Defualt to None which means the whole audio will be used.
+        resample_quality (str, optional): soxr quality ("QQ", "LQ", "MQ", "HQ" or "VHQ")
+                                used when the file has another sampling rate. Defaults to "VHQ".
 
     Returns:
         audio (np.ndarray): audio
     """
 
-    audio, sr = soundfile.read(adfile)
-    if len(audio.shape) > 1:
-        audio = audio[:, 0]
+    audio, sr = read_audio(adfile)
 
     if sampling_rate is not None and sr != sampling_rate:
-        audio = soxr.resample(audio, sr, sampling_rate, quality="VHQ")
+        audio = soxr.resample(audio, sr, sampling_rate, quality=resample_quality)
         sr = sampling_rate
 
     if segment_duration is not None:
@@ -119,6 +214,57 @@ def load_audio(
     return audio
 
 
+class AudioLoader:
+    """Loads whole audio files with `load_audio` and caches the results.
+
+    Entries are keyed by (path, mtime, size, sampling rate), so a file that is
+    rewritten is loaded again. Callers get copies and may modify them.
+    """
+
+    def __init__(
+        self,
+        sampling_rate: int = None,
+        volume_normalize: bool = False,
+        resample_quality: str = "VHQ",
+        cache_size: int = 16,
+        num_workers: int = 4,
+    ):
+        """
+        Args:
+            sampling_rate (int, optional): target sampling rate.
+            volume_normalize (bool): whether perform volume normalization.
+            resample_quality (str): soxr quality of the resampling.
+            cache_size (int): number of loaded files kept in memory.
+            num_workers (int): threads of `load_many`.
+        """
+        self.sampling_rate = sampling_rate
+        self.volume_normalize = volume_normalize
+        self.resample_quality = resample_quality
+        self.num_workers = num_workers
+        self.cache = LRUCache(cache_size)
+
+    def load(self, adfile: Path) -> np.ndarray:
+        stat = os.stat(adfile)
+        key = (os.fspath(adfile), stat.st_mtime_ns, stat.st_size, self.sampling_rate)
+        audio = self.cache.get(key)
+        if audio is None:
+            audio = load_audio(
+                adfile,
+                sampling_rate=self.sampling_rate,
+                volume_normalize=self.volume_normalize,
+                resample_quality=self.resample_quality,
+            )
+            self.cache.put(key, audio)
+        return audio.copy()
+
+    def load_many(self, adfiles: List[Path]) -> List[np.ndarray]:
+        """Load several files on a thread pool; soundfile and soxr release the GIL."""
+        if len(adfiles) <= 1 or self.num_workers <= 1:
+            return [self.load(adfile) for adfile in adfiles]
+        with ThreadPoolExecutor(min(self.num_workers, len(adfiles))) as pool:
+            return list(pool.map(self.load, adfiles))
+
+
 def random_select_audio_segment(audio: np.ndarray, length: int) -> np.ndarray:
     """get an audio segment given the length
 
@@ -183,12 +329,92 @@ def stft(
         return res
 
 
+class SpeechBoundaryDetector:
+    """Find the speech boundaries of an audio signal fed in chunks.
+
+    The RMS energy of windows of `window_duration` seconds, spaced a tenth of
+    a window apart, is computed from a cumulative sum of squared samples, so a
+    chunk costs O(len(chunk)) time and only the last window of samples is kept
+    between chunks.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        window_duration: float = 0.1,
+        energy_threshold: float = 0.01,
+        margin_factor: int = 2,
+    ):
+        """
+        Args:
+            sample_rate: Audio sample rate in Hz
+            window_duration: Duration of detection window in seconds
+            energy_threshold: RMS energy threshold for speech detection
+            margin_factor: Factor to determine extra margin around detected boundaries
+        """
+        self.window_size = int(window_duration * sample_rate)
+        self.step_size = max(1, self.window_size // 10)
+        self.margin = margin_factor * self.window_size
+        self.energy_threshold = energy_threshold
+
+        self.num_samples = 0
+        self.num_windows = 0
+        # Indices of the first and last windows above the threshold
+        self.first_speech = None
+        self.last_speech = None
+        # Samples from the start of the next window on
+        self._tail = np.zeros(0)
+
+    def feed(self, chunk: np.ndarray):
+        """Add the next samples of the signal."""
+        self.num_samples += len(chunk)
+        samples = np.concatenate([self._tail, chunk])
+        if len(samples) < self.window_size:
+            self._tail = samples
+            return
+
+        count = (len(samples) - self.window_size) // self.step_size + 1
+        power = np.zeros(len(samples) + 1)
+        np.cumsum(np.square(samples), out=power[1:])
+        starts = np.arange(count) * self.step_size
+        window_power = power[starts + self.window_size] - power[starts]
+        # Rounding of the cumulative sum can leave tiny negative values
+        energy = np.sqrt(np.maximum(window_power, 0.0) / self.window_size)
+
+        speech = np.flatnonzero(energy >= self.energy_threshold)
+        if len(speech) > 0:
+            if self.first_speech is None:
+                self.first_speech = self.num_windows + speech[0]
+            self.last_speech = self.num_windows + speech[-1]
+        self.num_windows += count
+        self._tail = samples[count * self.step_size :]
+
+    @property
+    def speech_detected(self) -> bool:
+        return self.first_speech is not None
+
+    def boundaries(self) -> Tuple[int, int]:
+        """Returns (start_index, end_index) of the speech in the samples fed so far.
+
+        Raises:
+            ValueError: If the audio contains only silence
+        """
+        if not self.speech_detected:
+            raise ValueError("No speech detected in audio (only silence)")
+        start = max(0, int(self.first_speech) * self.step_size - self.margin)
+        end = min(
+            self.num_samples, int(self.last_speech) * self.step_size + self.margin
+        )
+        return start, end
+
+
 def detect_speech_boundaries(
     wav: np.ndarray,
     sample_rate: int,
     window_duration: float = 0.1,
     energy_threshold: float = 0.01,
-    margin_factor: int = 2
+    margin_factor: int = 2,
+    chunk_size: int = 2**20,
 ) -> Tuple[int, int]:
     """Detect the start and end points of speech in an audio signal using RMS energy.
     
@@ -198,6 +424,7 @@ def detect_speech_boundaries(
         window_duration: Duration of detection window in seconds
         energy_threshold: RMS energy threshold for speech detection
         margin_factor: Factor to determine extra margin around detected boundaries
+        chunk_size: Samples processed at a time, which bounds the extra memory
         
     Returns:
         tuple: (start_index, end_index) of speech segment
@@ -205,24 +432,12 @@ def detect_speech_boundaries(
     Raises:
         ValueError: If the audio contains only silence
     """
-    window_size = int(window_duration * sample_rate)
-    margin = margin_factor * window_size
-    step_size = window_size // 10
-    
-    # Create sliding windows using stride tricks to avoid loops
-    windows = sliding_window_view(wav, window_size)[::step_size]
-    
-    # Calculate RMS energy for each window
-    energy = np.sqrt(np.mean(windows ** 2, axis=1))
-    speech_mask = energy >= energy_threshold
-    
-    if not np.any(speech_mask):
-        raise ValueError("No speech detected in audio (only silence)")
-    
-    start = max(0, np.argmax(speech_mask) * step_size - margin)
-    end = min(len(wav), (len(speech_mask) - 1 - np.argmax(speech_mask[::-1])) * step_size + margin)
-    
-    return start, end
+    detector = SpeechBoundaryDetector(
+        sample_rate, window_duration, energy_threshold, margin_factor
+    )
+    for start in range(0, len(wav), chunk_size):
+        detector.feed(wav[start : start + chunk_size])
+    return detector.boundaries()
 
 
 def remove_silence_on_both_ends(
@@ -254,6 +469,100 @@ def remove_silence_on_both_ends(
     return wav[start:end]
 
 
+def remove_silence_stream(
+    chunks: Iterable[np.ndarray],
+    sample_rate: int,
+    window_duration: float = 0.1,
+    volume_threshold: float = 0.01,
+) -> Iterator[np.ndarray]:
+    """Remove silence from both ends of an audio signal that arrives in chunks.
+
+    Leading silence is dropped as it arrives; audio after the last speech is
+    held back until more speech follows or the input ends. The concatenated
+    output equals `remove_silence_on_both_ends` of the concatenated input.
+
+    Args:
+        chunks: Consecutive pieces of the input audio signal
+        sample_rate: Audio sample rate in Hz
+        window_duration: Duration of detection window in seconds
+        volume_threshold: Amplitude threshold for silence detection
+
+    Yields:
+        np.ndarray: Consecutive pieces of the trimmed signal
+
+    Raises:
+        ValueError: If the audio contains only silence
+    """
+    detector = SpeechBoundaryDetector(sample_rate, window_duration, volume_threshold)
+    # Samples not yet emitted or dropped, starting at sample `pending_start`
+    pending, pending_start = None, 0
+    for chunk in chunks:
+        detector.feed(chunk)
+        pending = chunk if pending is None else np.concatenate([pending, chunk])
+
+        if not detector.speech_detected:
+            # Speech can start no earlier than the next window
+            start = max(0, detector.num_windows * detector.step_size - detector.margin)
+            end = start
+        else:
+            start, end = detector.boundaries()
+        if start > pending_start:
+            pending = pending[start - pending_start :]
+            pending_start = start
+        if end > pending_start:
+            yield pending[: end - pending_start]
+            pending = pending[end - pending_start :]
+            pending_start = end
+
+    if not detector.speech_detected:
+        raise ValueError("No speech detected in audio (only silence)")
+
+
+def crossfade(tail: np.ndarray, head: np.ndarray) -> np.ndarray:
+    """Linearly crossfade the end of one audio chunk into the start of the next.
+
+    Args:
+        tail: Last samples of the previous chunk
+        head: First samples of the next chunk, same length as `tail`
+
+    Returns:
+        np.ndarray: The blended samples that replace `head`
+    """
+    assert len(tail) == len(head)
+    fade_in = np.linspace(0.0, 1.0, len(head), endpoint=False, dtype=head.dtype)
+    return tail * (1.0 - fade_in) + head * fade_in
+
+
+def crossfade_stream(
+    chunks: Iterable[np.ndarray], fade_length: int
+) -> Iterator[np.ndarray]:
+    """Join consecutive audio chunks with a crossfade, yielding as they arrive.
+
+    The last `fade_length` samples of each chunk are held back and blended into
+    the start of the next one, so every chunk is read only once the previous
+    one has been yielded.
+
+    Args:
+        chunks: Audio chunks, e.g. the waveforms of consecutive text segments
+        fade_length: Crossfade length in samples
+
+    Yields:
+        np.ndarray: The joined audio, at least one array per input chunk
+    """
+    tail = None
+    for chunk in chunks:
+        if tail is not None:
+            overlap = min(len(tail), len(chunk))
+            if overlap < len(tail):
+                yield tail[: len(tail) - overlap]
+            chunk = chunk.copy()
+            chunk[:overlap] = crossfade(tail[len(tail) - overlap :], chunk[:overlap])
+        overlap = min(fade_length, len(chunk))
+        yield chunk[: len(chunk) - overlap]
+        tail = chunk[len(chunk) - overlap :]
+    if tail is not None:
+        yield tail
+
 
 def hertz_to_mel(pitch: float) -> float:
     """
@@ -0,0 +1,166 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    This script contains small caches used to skip repeated work at inference
+    time: an in-memory LRU cache with hit/miss counters and an optional
+    on-disk tier that survives restarts.
+"""
+
+import os
+import torch
+import pickle
+import hashlib
+import tempfile
+import threading
+
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+
+def hash_bytes(*chunks: bytes) -> str:
+    """Returns a hex digest identifying the concatenation of `chunks`."""
+    hasher = hashlib.blake2b(digest_size=20)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def tensors_key(*tensors: torch.Tensor) -> tuple:
+    """Identifies the contents of tensors: in-place updates, `.to()` and
+    `load_state_dict` all change it."""
+    return tuple((t._version, t.data_ptr(), t.dtype, t.device) for t in tensors)
+
+
+class DiskCache:
+    """Directory of `torch.save`d values, one file per key.
+
+    Values must be loadable with `torch.load(weights_only=True)`, e.g. tensors or
+    tuples/dicts of tensors. When `max_bytes` is set, the least recently used files
+    are deleted once the directory grows beyond it.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = None):
+        """
+        Args:
+            cache_dir (Path): Directory holding the cached values.
+            max_bytes (int, optional): Size bound of the directory. Defaults to None (unbounded).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pt"
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            value = torch.load(path, map_location="cpu", weights_only=True)
+        except FileNotFoundError:
+            return None
+        except (EOFError, RuntimeError, pickle.UnpicklingError):
+            # Truncated or corrupted entry: drop it so it is rebuilt on `put`
+            path.unlink(missing_ok=True)
+            return None
+        # Touch the file so eviction follows the access order
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Any):
+        # Write to a temporary file first so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        torch.save(value, tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+        if self.max_bytes is not None:
+            self.evict()
+
+    def evict(self):
+        """Deletes the least recently used files until the size bound is met."""
+        entries = []
+        for path in self.cache_dir.glob("*.pt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with an optional `DiskCache` tier."""
+
+    def __init__(self, maxsize: int = 16, disk_cache: DiskCache = None):
+        """
+        Args:
+            maxsize (int): Number of entries kept in memory.
+            disk_cache (DiskCache, optional): Second tier consulted on memory misses.
+        """
+        self.maxsize = maxsize
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value or None."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+        value = self.disk_cache.get(key) if self.disk_cache is not None else None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._insert(key, value)
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, value)
+
+    def _insert(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit/miss counters and the number of entries in memory."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
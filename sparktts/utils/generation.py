@@ -0,0 +1,382 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    This script contains helpers that hook into the LLM `generate` loop.
+"""
+
+import math
+import torch
+
+from queue import Queue
+from threading import Event
+from typing import Dict, Iterator, List
+from contextlib import contextmanager
+from transformers import LogitsProcessor, StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+
+# BiCodec semantic tokens per second of audio
+SEMANTIC_TOKEN_RATE = 50
+
+# Slowest plausible speaking rates, in characters per second
+CJK_CHARS_PER_SECOND = 3.0
+OTHER_CHARS_PER_SECOND = 10.0
+PAUSE_SECONDS = 0.5
+PAUSE_PUNCTUATION = set(",.;:!?，。；：！？、…")
+
+# How much slower than `moderate` each speed label may be
+SPEED_FACTOR = {"very_low": 2.0, "low": 1.5}
+
+
+def is_cjk(char: str) -> bool:
+    """Whether `char` is a CJK ideograph, kana or hangul syllable."""
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x4E00 <= code <= 0x9FFF
+        or 0xAC00 <= code <= 0xD7AF
+        or 0xF900 <= code <= 0xFAFF
+    )
+
+
+def estimate_max_new_tokens(
+    text: str,
+    speed: str = None,
+    max_new_tokens: int = 3000,
+    headroom: float = 2.0,
+    min_duration: float = 2.0,
+    extra_tokens: int = 64,
+) -> int:
+    """Estimate a generation budget from the length and script of `text`.
+
+    The duration is estimated from the slowest plausible speaking rate of each
+    character class plus a pause per punctuation mark, scaled by `headroom` and
+    converted to semantic tokens. `extra_tokens` covers the global tokens and
+    delimiters generated before the semantic tokens.
+
+    Args:
+        text (str): The text to be converted to speech.
+        speed (str, optional): Speed label of voice creation.
+        max_new_tokens (int): Upper bound of the budget.
+        headroom (float): Safety factor applied to the estimated duration.
+        min_duration (float): Lower bound of the estimated duration in seconds.
+        extra_tokens (int): Tokens added on top of the semantic tokens.
+
+    Returns:
+        int: The `max_new_tokens` to generate with.
+    """
+    cjk_chars, other_chars, pauses = 0, 0, 0
+    for char in text:
+        if is_cjk(char):
+            cjk_chars += 1
+        elif char.isalnum():
+            other_chars += 1
+        elif char in PAUSE_PUNCTUATION:
+            pauses += 1
+
+    duration = (
+        cjk_chars / CJK_CHARS_PER_SECOND
+        + other_chars / OTHER_CHARS_PER_SECOND
+        + pauses * PAUSE_SECONDS
+    ) * SPEED_FACTOR.get(speed, 1.0)
+    duration = max(duration * headroom, min_duration)
+
+    budget = math.ceil(duration * SEMANTIC_TOKEN_RATE) + extra_tokens
+    return min(budget, max_new_tokens)
+
+
+@contextmanager
+def seeded_rng(seed: int = None, device: torch.device = None) -> Iterator[None]:
+    """Seed the torch RNGs for the block and restore their previous state after it.
+
+    Sampling in `generate` draws from the global RNG, so a seeded block only gives
+    reproducible results while no other thread samples concurrently. With
+    `seed=None` the block runs unseeded and the RNG state is left alone.
+
+    Args:
+        seed (int, optional): Seed of the block.
+        device (torch.device, optional): Device whose RNG is restored besides the CPU's.
+    """
+    if seed is None:
+        yield
+        return
+
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    devices = [device] if device.type == "cuda" else []
+    with torch.random.fork_rng(devices=devices):
+        torch.manual_seed(seed)
+        yield
+
+
+class TokenIdStreamer(BaseStreamer):
+    """Streamer that hands the generated token ids of a single sample to another thread.
+
+    `generate` runs in a worker thread and calls `put` after every decoding step;
+    the consumer iterates over the streamer and receives the new token ids as they
+    are produced. The prompt ids passed in the first `put` call are skipped.
+    """
+
+    def __init__(self, timeout: float = None):
+        """
+        Args:
+            timeout (float, optional): Seconds to wait for the next tokens before
+                raising `queue.Empty`. Defaults to None (wait forever).
+        """
+        self.queue = Queue()
+        self.timeout = timeout
+        self.next_tokens_are_prompt = True
+        self.error = None
+
+    def put(self, value: torch.Tensor):
+        if value.dim() > 1:
+            assert value.shape[0] == 1, "TokenIdStreamer only supports batch size 1"
+            value = value[0]
+
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+
+        self.queue.put(value.tolist())
+
+    def end(self, error: Exception = None):
+        """Signal the end of generation, optionally forwarding the error of the worker."""
+        self.error = error
+        self.queue.put(None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> List[int]:
+        value = self.queue.get(timeout=self.timeout)
+        if value is None:
+            if self.error is not None:
+                raise self.error
+            raise StopIteration()
+        return value
+
+
+class SparkTTSLogitsProcessor(LogitsProcessor):
+    """Phase-aware constrained sampling for Spark-TTS generation.
+
+    Every row of the batch is tracked through the phases of the output grammar:
+
+        free text -> <|start_global_token|> -> 32 global tokens -> <|end_global_token|>
+        -> <|start_semantic_token|> -> semantic tokens -> EOS
+
+    Inside the global and semantic phases only the legal token range is kept, and
+    temperature, top-k and top-p are applied to that slice alone; the fixed
+    delimiters are forced. The free phase (attribute values predicted in
+    `controllable_tts` mode) samples from the full vocabulary except the audio
+    tokens, which are only legal inside their own segments. EOS is only legal in
+    the free and semantic phases: a row cannot end inside its global tokens or
+    before its semantic tokens start. Because sampling is done here, `generate`
+    must be called with `temperature=1.0, top_k=0, top_p=1.0`.
+    """
+
+    FREE, GLOBAL, AFTER_GLOBAL, SEMANTIC, DONE = range(5)
+
+    def __init__(
+        self,
+        semantic_ids: torch.Tensor,
+        global_ids: torch.Tensor,
+        start_global_id: int,
+        end_global_id: int,
+        start_semantic_id: int,
+        eos_token_id: int,
+        temperature: float = 0.8,
+        top_k: int = 50,
+        top_p: float = 0.95,
+        num_global_tokens: int = 32,
+    ):
+        """
+        Args:
+            semantic_ids (torch.Tensor): Vocabulary ids of the semantic tokens.
+            global_ids (torch.Tensor): Vocabulary ids of the global tokens.
+            start_global_id (int): Id of `<|start_global_token|>`.
+            end_global_id (int): Id of `<|end_global_token|>`.
+            start_semantic_id (int): Id of `<|start_semantic_token|>`.
+            eos_token_id (int): Id of the end-of-sequence token.
+            temperature (float): Sampling temperature.
+            top_k (int): Top-k sampling parameter. 0 or None disables it.
+            top_p (float): Top-p (nucleus) sampling parameter.
+            num_global_tokens (int): Number of global tokens per utterance.
+        """
+        self.semantic_ids = torch.cat([semantic_ids, torch.tensor([eos_token_id])])
+        self.global_ids = global_ids
+        self.audio_ids = torch.cat([semantic_ids, global_ids])
+        self.start_global_id = start_global_id
+        self.end_global_id = end_global_id
+        self.start_semantic_id = start_semantic_id
+        self.eos_token_id = eos_token_id
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.num_global_tokens = num_global_tokens
+
+        self.phases = None
+        self.global_counts = None
+
+    def _initial_phase(self, prompt_ids: List[int]):
+        """Derive the phase of a row from the last delimiter of its prompt."""
+        for position in range(len(prompt_ids) - 1, -1, -1):
+            token = prompt_ids[position]
+            if token == self.start_semantic_id:
+                return self.SEMANTIC, 0
+            if token == self.end_global_id:
+                return self.AFTER_GLOBAL, 0
+            if token == self.start_global_id:
+                return self.GLOBAL, len(prompt_ids) - position - 1
+        return self.FREE, 0
+
+    def _advance(self, row: int, token: int):
+        """Update the phase of a row with its last generated token."""
+        phase = self.phases[row]
+        if phase == self.FREE and token == self.start_global_id:
+            self.phases[row], self.global_counts[row] = self.GLOBAL, 0
+        elif phase == self.GLOBAL:
+            if token == self.end_global_id:
+                self.phases[row] = self.AFTER_GLOBAL
+            else:
+                self.global_counts[row] += 1
+        elif phase == self.AFTER_GLOBAL and token == self.start_semantic_id:
+            self.phases[row] = self.SEMANTIC
+        elif phase == self.SEMANTIC and token == self.eos_token_id:
+            self.phases[row] = self.DONE
+
+    def _filter(self, logits: torch.Tensor) -> torch.Tensor:
+        """Apply temperature, top-k and top-p to a 1-D slice of logits."""
+        logits = logits / self.temperature
+        if self.top_k:
+            values, indices = torch.topk(logits, min(int(self.top_k), logits.shape[-1]))
+        else:
+            values, indices = torch.sort(logits, descending=True)
+
+        if self.top_p is not None and self.top_p < 1.0:
+            probs = values.softmax(dim=-1)
+            # Drop a token once the tokens ranked before it already cover top_p
+            remove = (probs.cumsum(dim=-1) - probs) > self.top_p
+            values = values.masked_fill(remove, -float("inf"))
+
+        filtered = torch.full_like(logits, -float("inf"))
+        filtered[indices] = values
+        return filtered
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor
+    ) -> torch.FloatTensor:
+        if self.phases is None:
+            states = [self._initial_phase(row.tolist()) for row in input_ids]
+            self.phases = [phase for phase, _ in states]
+            self.global_counts = [count for _, count in states]
+        else:
+            for row, token in enumerate(input_ids[:, -1].tolist()):
+                self._advance(row, token)
+
+        if self.semantic_ids.device != scores.device:
+            self.semantic_ids = self.semantic_ids.to(scores.device)
+            self.global_ids = self.global_ids.to(scores.device)
+            self.audio_ids = self.audio_ids.to(scores.device)
+
+        processed = torch.full_like(scores, -float("inf"))
+        for row, phase in enumerate(self.phases):
+            if phase == self.FREE:
+                logits = scores[row].index_fill(0, self.audio_ids, -float("inf"))
+                processed[row] = self._filter(logits)
+            elif phase == self.GLOBAL and self.global_counts[row] < self.num_global_tokens:
+                allowed = self.global_ids
+                processed[row, allowed] = self._filter(scores[row, allowed])
+            elif phase == self.GLOBAL:
+                processed[row, self.end_global_id] = 0
+            elif phase == self.AFTER_GLOBAL:
+                processed[row, self.start_semantic_id] = 0
+            elif phase == self.SEMANTIC:
+                allowed = self.semantic_ids
+                processed[row, allowed] = self._filter(scores[row, allowed])
+            else:
+                # Finished rows are padded by `generate`, their scores are unused
+                processed[row] = scores[row]
+
+        return processed
+
+
+class RepetitionStoppingCriteria(StoppingCriteria):
+    """Stop rows whose recent tokens have degenerated into a repetition loop.
+
+    A row is stopped once its last `window` generated tokens are periodic with a
+    period of at most `max_period` tokens, e.g. the same semantic token or a short
+    cycle of tokens repeated for several seconds. `loop_starts` then maps the row
+    to the index, among its generated tokens, where the repetition begins, so
+    callers can cut the loop off.
+    """
+
+    def __init__(self, window: int = 150, max_period: int = 25):
+        """
+        Args:
+            window (int): Number of recent tokens inspected (150 semantic tokens = 3s).
+            max_period (int): Longest repeated pattern detected.
+        """
+        assert max_period < window
+        self.window = window
+        self.max_period = max_period
+        self.prompt_length = None
+        self.loop_starts: Dict[int, int] = {}
+
+    def _loop_start(self, generated_ids: torch.Tensor, period: int) -> int:
+        """Index of the first token from which `generated_ids` has `period`."""
+        mismatches = (generated_ids[period:] != generated_ids[:-period]).nonzero()
+        return 0 if len(mismatches) == 0 else mismatches[-1].item() + 1
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs
+    ) -> torch.BoolTensor:
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1] - 1
+
+        is_done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        if input_ids.shape[1] - self.prompt_length < self.window:
+            return is_done
+
+        recent = input_ids[:, -self.window :]
+        for period in range(1, self.max_period + 1):
+            is_periodic = (recent[:, period:] == recent[:, :-period]).all(dim=-1)
+            for row in is_periodic.nonzero().flatten().tolist():
+                if not is_done[row] and row not in self.loop_starts:
+                    self.loop_starts[row] = self._loop_start(
+                        input_ids[row, self.prompt_length :], period
+                    )
+            is_done |= is_periodic
+        return is_done
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Stop every row once `cancel` is called, e.g. from the thread consuming a stream."""
+
+    def __init__(self):
+        self.cancelled = Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs
+    ) -> torch.BoolTensor:
+        return torch.full(
+            (input_ids.shape[0],),
+            self.cancelled.is_set(),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
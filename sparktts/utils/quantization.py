@@ -0,0 +1,85 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    This script contains helpers that quantize the weights of loaded models for
+    CPU inference.
+"""
+
+import torch
+import torch.nn as nn
+
+from typing import Callable, List
+from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+
+QUANTIZE_MODES = ("int8-dynamic",)
+
+
+def check_quantize_mode(
+    quantize: str, dtype: torch.dtype = None, device: torch.device = None
+):
+    """Validate a `quantize` load option.
+
+    Args:
+        quantize (str): None or one of `QUANTIZE_MODES`.
+        dtype (torch.dtype, optional): Compute dtype requested together with it.
+        device (torch.device, optional): Device the model runs on.
+    """
+    if quantize is None:
+        return
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"quantize must be one of {QUANTIZE_MODES}, got {quantize!r}")
+    if dtype not in (None, torch.float32):
+        raise ValueError(f"{quantize} quantization requires float32 activations")
+    if device is not None and torch.device(device).type != "cpu":
+        raise ValueError(f"{quantize} quantization only runs on CPU")
+
+
+def linear_names(model: nn.Module, include: Callable[[str], bool]) -> List[str]:
+    """Names of the `nn.Linear` submodules of `model` selected by `include`."""
+    return [
+        name
+        for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and include(name)
+    ]
+
+
+def quantize_linear_dynamic(model: nn.Module, names: List[str]) -> nn.Module:
+    """Replace the named `nn.Linear` submodules with dynamic int8 Linears in place.
+
+    The weights are quantized per tensor once; activations are quantized on the
+    fly, so the replaced layers only run on CPU in float32.
+
+    Args:
+        model (nn.Module): Model in eval mode.
+        names (List[str]): Submodule names, see `linear_names`.
+
+    Returns:
+        nn.Module: The model itself.
+    """
+    qconfig_spec = {name: default_dynamic_qconfig for name in names}
+    return quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+
+def quantize_llm_dynamic(model: nn.Module) -> nn.Module:
+    """Quantize the attention and MLP projections of a causal LM.
+
+    Embeddings are not Linears and stay in float. `lm_head` stays in float too: it
+    is tied to the embeddings, and rounding it would perturb the ranking of the
+    close audio-token logits that sampling is restricted to.
+    """
+    names = linear_names(model, lambda name: not name.startswith("lm_head"))
+    return quantize_linear_dynamic(model, names)
@@ -0,0 +1,116 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    This script contains helpers that split long texts into segments that are
+    synthesized independently.
+"""
+
+import re
+
+from typing import List
+
+from sparktts.utils.generation import is_cjk
+
+
+# Sentence ends: CJK stops anywhere, Latin stops only before whitespace so that
+# decimals ("3.14") and urls are kept intact. Closing quotes stay with the sentence.
+SENTENCE_END = re.compile(r"(?:[。！？…]+|[.!?]+(?=\s|$))[”’」』）)\"']*")
+CLAUSE_END = re.compile(r"[，、；：,;:](?:\s*)")
+
+# A CJK character takes about as long to speak as this many Latin characters
+CJK_CHAR_WEIGHT = 3
+
+
+def text_weight(text: str) -> int:
+    """Length of `text` in Latin-character equivalents of speaking time."""
+    return sum(CJK_CHAR_WEIGHT if is_cjk(char) else 1 for char in text)
+
+
+def _split_after(text: str, pattern: re.Pattern) -> List[str]:
+    """Split `text` after every match of `pattern`, keeping the delimiters."""
+    pieces, start = [], 0
+    for match in pattern.finditer(text):
+        pieces.append(text[start : match.end()])
+        start = match.end()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece.strip()]
+
+
+def _split_hard(text: str, max_weight: int) -> List[str]:
+    """Split a piece without punctuation at spaces, or between characters as a last resort."""
+    pieces, current = [], ""
+    for word in re.findall(r"\S+\s*|\s+", text):
+        if current and text_weight(current + word) > max_weight:
+            pieces.append(current)
+            current = ""
+        while text_weight(word) > max_weight:
+            cut = 1
+            while text_weight(word[: cut + 1]) <= max_weight:
+                cut += 1
+            pieces.append(word[:cut])
+            word = word[cut:]
+        current += word
+    pieces.append(current)
+    return [piece for piece in pieces if piece.strip()]
+
+
+def split_text(text: str, max_weight: int = 200) -> List[str]:
+    """Split a long text into segments at sentence and clause boundaries.
+
+    The text is split into sentences first; sentences heavier than `max_weight`
+    are split at clause punctuation and, failing that, at spaces. Consecutive
+    pieces are then merged greedily as long as the segment stays within
+    `max_weight`, so short sentences do not become separate segments.
+
+    Args:
+        text (str): The text to be split.
+        max_weight (int): Maximum segment length, see `text_weight`.
+
+    Returns:
+        List[str]: The stripped segments, in order.
+    """
+    pieces = []
+    for sentence in _split_after(text, SENTENCE_END):
+        if text_weight(sentence) <= max_weight:
+            pieces.append(sentence)
+            continue
+        for clause in _split_after(sentence, CLAUSE_END):
+            if text_weight(clause) <= max_weight:
+                pieces.append(clause)
+            else:
+                pieces += _split_hard(clause, max_weight)
+
+    segments, current = [], ""
+    for piece in pieces:
+        if current and text_weight((current + piece).strip()) > max_weight:
+            segments.append(current.strip())
+            current = ""
+        current += piece
+    if current.strip():
+        segments.append(current.strip())
+
+    return segments
+
+
+# test
+if __name__ == "__main__":
+    text = (
+        "身临其境，换新体验。塑造开源语音合成新范式，让智能语音更自然。"
+        "Spark-TTS is an efficient text-to-speech system. It costs $3.14 per hour, "
+        "and it reuses the speaker of the first sentence for the rest of the text!"
+    )
+    for segment in split_text(text, max_weight=60):
+        print(text_weight(segment), segment)
@@ -1,3 +1,8 @@
+import torch
+
+from typing import List
+
+
 TASK_TOKEN_MAP = {
     "vc": "<|task_vc|>",
     "tts": "<|task_tts|>",
@@ -154,6 +159,164 @@ class TokenParser:
         return f"<|emotion_{emo_id}|>"
 
 
+class PromptIdBuilder:
+    """Build LLM input ids directly from BiCodec token indices.
+
+    Global and semantic token indices are mapped to vocabulary ids with lookup
+    tables built once, and only the free text is run through the tokenizer, so
+    prompts never round-trip through `<|bicodec_semantic_*|>` strings.
+    """
+
+    def __init__(
+        self, tokenizer, semantic_vocab_size: int = 8192, global_vocab_size: int = 4096
+    ):
+        """
+        Args:
+            tokenizer: Tokenizer of the LLM.
+            semantic_vocab_size (int): Number of BiCodec semantic tokens.
+            global_vocab_size (int): Number of BiCodec global tokens.
+        """
+        self.tokenizer = tokenizer
+        self.semantic_ids = self.token_ids(
+            *[f"<|bicodec_semantic_{i}|>" for i in range(semantic_vocab_size)]
+        )
+        self.global_ids = self.token_ids(
+            *[f"<|bicodec_global_{i}|>" for i in range(global_vocab_size)]
+        )
+
+    def token_ids(self, *tokens: str) -> torch.Tensor:
+        """Look up the ids of added tokens such as `<|start_content|>`."""
+        ids = self.tokenizer.convert_tokens_to_ids(list(tokens))
+        missing = [
+            token
+            for token, i in zip(tokens, ids)
+            if i is None or i == self.tokenizer.unk_token_id
+        ]
+        assert not missing, f"tokens missing from the LLM vocabulary: {missing[:3]}"
+        return torch.tensor(ids, dtype=torch.long)
+
+    def text_ids(self, text: str) -> torch.Tensor:
+        """Tokenize a free text segment."""
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        return torch.tensor(ids, dtype=torch.long)
+
+    def tts(
+        self,
+        text: str,
+        global_tokens: torch.Tensor,
+        prompt_text: str = None,
+        semantic_tokens: torch.Tensor = None,
+    ) -> torch.Tensor:
+        """Build the voice cloning prompt.
+
+        Args:
+            text (str): The text to be converted to speech.
+            global_tokens (torch.Tensor): Global tokens of the prompt audio.
+            prompt_text (str, optional): Transcript of the prompt audio. When given,
+                the semantic tokens of the prompt audio are appended as well.
+            semantic_tokens (torch.Tensor, optional): Semantic tokens of the prompt audio.
+
+        Returns:
+            torch.Tensor: Input ids. shape: (seq_len,)
+        """
+        content = text if prompt_text is None else prompt_text + text
+        parts = [
+            self.token_ids(TASK_TOKEN_MAP["tts"], "<|start_content|>"),
+            self.text_ids(content),
+            self.token_ids("<|end_content|>", "<|start_global_token|>"),
+            self.global_ids[global_tokens.reshape(-1).cpu()],
+            self.token_ids("<|end_global_token|>"),
+        ]
+        if prompt_text is not None:
+            parts += [
+                self.token_ids("<|start_semantic_token|>"),
+                self.semantic_ids[semantic_tokens.reshape(-1).cpu()],
+            ]
+        return torch.cat(parts)
+
+    def controllable_tts(
+        self, text: str, gender: str, pitch: str, speed: str
+    ) -> torch.Tensor:
+        """Build the voice creation prompt.
+
+        Returns:
+            torch.Tensor: Input ids. shape: (seq_len,)
+        """
+        return torch.cat(
+            [
+                self.token_ids(TASK_TOKEN_MAP["controllable_tts"], "<|start_content|>"),
+                self.text_ids(text),
+                self.token_ids(
+                    "<|end_content|>",
+                    "<|start_style_label|>",
+                    f"<|gender_{GENDER_MAP[gender]}|>",
+                    f"<|pitch_label_{LEVELS_MAP[pitch]}|>",
+                    f"<|speed_label_{LEVELS_MAP[speed]}|>",
+                    "<|end_style_label|>",
+                ),
+            ]
+        )
+
+
+def pad_left(input_ids: List[torch.Tensor], pad_token_id: int):
+    """Left-pad 1-D input ids into a batch.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor]: input ids and attention mask. shape: (batch_size, max_len)
+    """
+    max_length = max(len(ids) for ids in input_ids)
+    batch = torch.full((len(input_ids), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(input_ids), max_length), dtype=torch.long)
+    for i, ids in enumerate(input_ids):
+        batch[i, max_length - len(ids) :] = ids
+        attention_mask[i, max_length - len(ids) :] = 1
+    return batch, attention_mask
+
+
+class GeneratedTokenParser:
+    """Map generated LLM ids straight to BiCodec token indices.
+
+    Reverse lookup tables turn every vocabulary id into its semantic/global index
+    (or -1 for any other token), so parsing is a gather plus a mask instead of
+    `batch_decode` and a regex. Works on partial sequences as well, which lets
+    streaming consumers parse each new step on its own.
+    """
+
+    def __init__(
+        self, semantic_ids: torch.Tensor, global_ids: torch.Tensor, vocab_size: int
+    ):
+        """
+        Args:
+            semantic_ids (torch.Tensor): Vocabulary id of each semantic token index.
+            global_ids (torch.Tensor): Vocabulary id of each global token index.
+            vocab_size (int): Size of the LLM vocabulary.
+        """
+        # One extra slot maps out-of-vocabulary ids to -1
+        self.vocab_size = vocab_size
+        self.semantic_index = self._reverse(semantic_ids, vocab_size)
+        self.global_index = self._reverse(global_ids, vocab_size)
+
+    @staticmethod
+    def _reverse(ids: torch.Tensor, vocab_size: int) -> torch.Tensor:
+        index = torch.full((vocab_size + 1,), -1, dtype=torch.long)
+        index[ids] = torch.arange(len(ids))
+        return index
+
+    def _lookup(self, index: torch.Tensor, ids: torch.Tensor) -> torch.Tensor:
+        if index.device != ids.device:
+            index = index.to(ids.device)
+        indices = index[ids.long().clamp(0, self.vocab_size)]
+        return indices[indices >= 0]
+
+    def semantic_tokens(self, ids: torch.Tensor) -> torch.Tensor:
+        """Returns the semantic token indices found in `ids`, in order."""
+        return self._lookup(self.semantic_index, ids)
+
+    def global_tokens(self, ids: torch.Tensor) -> torch.Tensor:
+        """Returns the global token indices found in `ids`, in order."""
+        return self._lookup(self.global_index, ids)
+
+
 # test
 if __name__ == "__main__":
     from transformers import AutoTokenizer
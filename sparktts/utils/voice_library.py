@@ -0,0 +1,260 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    This script contains the voice library: a single file holding the BiCodec
+    tokens, transcripts and metadata of many reference voices, which is memory
+    mapped so that worker processes share its pages instead of loading it.
+
+    Layout: an 8 byte magic, the format version (uint32), 4 reserved bytes, the
+    length of a JSON header (uint64), the header, then the sections it lists,
+    each aligned to 64 bytes. Voices are sorted by ID, so a lookup is a binary
+    search over the ID section and nothing is indexed in memory.
+"""
+
+import os
+import json
+import struct
+import tempfile
+import numpy as np
+
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple
+
+
+MAGIC = b"SPKVOICE"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct("<8sI4xQ")
+
+# BiCodec codebooks have 4096 global and 8192 semantic codes
+TOKEN_DTYPE = np.int16
+
+
+class Voice(NamedTuple):
+    """One voice of a `VoiceLibrary`."""
+
+    voice_id: str
+    global_tokens: np.ndarray
+    semantic_tokens: np.ndarray
+    prompt_text: str
+    metadata: Dict[str, Any]
+
+
+def _pack_ragged(chunks: List[np.ndarray], dtype: np.dtype):
+    """Concatenate variable-length arrays; returns (flat, offsets of every chunk and the end)."""
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+    flat = np.concatenate(
+        [np.zeros(0, dtype)] + [np.asarray(chunk, dtype=dtype) for chunk in chunks]
+    )
+    return flat, offsets
+
+
+def _pack_strings(strings: List[str]):
+    return _pack_ragged(
+        [np.frombuffer(string.encode("utf-8"), dtype=np.uint8) for string in strings],
+        np.uint8,
+    )
+
+
+def write_voice_library(
+    voices: List[Voice], output_path: Path, info: Dict[str, Any] = None
+) -> Path:
+    """Write voices into a library file.
+
+    The file is written next to `output_path` and moved into place, so workers
+    that map the previous version keep reading a consistent file.
+
+    Args:
+        voices (List[Voice]): Voices with unique IDs, in any order. A prompt text
+            of None is stored as an empty transcript.
+        output_path (Path): Path of the library file.
+        info (Dict[str, Any], optional): JSON serializable description of the
+            library, e.g. the model it was built with.
+
+    Returns:
+        Path: `output_path`.
+    """
+    voices = sorted(voices, key=lambda voice: voice.voice_id)
+    voice_ids = [voice.voice_id for voice in voices]
+    if not voices:
+        raise ValueError("a voice library needs at least one voice")
+    if len(set(voice_ids)) != len(voice_ids):
+        raise ValueError("voice IDs must be unique")
+
+    global_tokens = np.stack(
+        [np.asarray(voice.global_tokens).reshape(-1) for voice in voices]
+    ).astype(TOKEN_DTYPE)
+
+    # Ragged sections are stored flat, with an `_offsets` section beside them
+    arrays = {"global_tokens": global_tokens}
+    arrays["voice_ids"], arrays["voice_ids_offsets"] = _pack_strings(voice_ids)
+    arrays["semantic_tokens"], arrays["semantic_tokens_offsets"] = _pack_ragged(
+        [np.asarray(voice.semantic_tokens).reshape(-1) for voice in voices],
+        TOKEN_DTYPE,
+    )
+    arrays["prompt_texts"], arrays["prompt_texts_offsets"] = _pack_strings(
+        [voice.prompt_text or "" for voice in voices]
+    )
+    arrays["metadata"], arrays["metadata_offsets"] = _pack_strings(
+        [json.dumps(voice.metadata or {}, ensure_ascii=False) for voice in voices]
+    )
+
+    # Section offsets count from the first aligned byte after the header
+    sections, offset = {}, 0
+    for name, array in arrays.items():
+        sections[name] = {
+            "offset": offset,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = {
+        "num_voices": len(voices),
+        "sections": sections,
+        "info": info or {},
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(PREAMBLE.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + sections[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class VoiceLibrary:
+    """Read-only, memory-mapped view of a file written by `write_voice_library`.
+
+    Every section is a numpy view into the mapping; pages are only read when a
+    voice is looked up and are shared by all processes mapping the same file.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path (Path): Library file.
+        """
+        self.path = Path(path)
+        self._mmap = np.memmap(self.path, dtype=np.uint8, mode="r")
+
+        magic, version, header_length = PREAMBLE.unpack(
+            self._mmap[: PREAMBLE.size].tobytes()
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a voice library")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"{self.path} has format version {version}, expected {FORMAT_VERSION}"
+            )
+        header_end = PREAMBLE.size + header_length
+        header = json.loads(self._mmap[PREAMBLE.size : header_end].tobytes())
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        self.info = header["info"]
+        self._sections = {}
+        for name, section in header["sections"].items():
+            dtype = np.dtype(section["dtype"])
+            start = data_start + section["offset"]
+            count = int(np.prod(section["shape"]))
+            self._sections[name] = (
+                self._mmap[start : start + count * dtype.itemsize]
+                .view(dtype)
+                .reshape(section["shape"])
+            )
+        self._num_voices = header["num_voices"]
+
+    def __len__(self) -> int:
+        return self._num_voices
+
+    def _ragged(self, name: str, index: int) -> np.ndarray:
+        offsets = self._sections[f"{name}_offsets"]
+        return self._sections[name][offsets[index] : offsets[index + 1]]
+
+    def _string(self, name: str, index: int) -> str:
+        return self._ragged(name, index).tobytes().decode("utf-8")
+
+    def voice_id(self, index: int) -> str:
+        """ID of the voice at `index` in ID order."""
+        return self._string("voice_ids", index)
+
+    def voice_ids(self) -> Iterator[str]:
+        return (self.voice_id(index) for index in range(len(self)))
+
+    def index(self, voice_id: str) -> int:
+        """Position of `voice_id`, found by binary search; raises KeyError if absent."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.voice_id(mid) < voice_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self) or self.voice_id(lo) != voice_id:
+            raise KeyError(f"voice {voice_id!r} is not in {self.path}")
+        return lo
+
+    def __contains__(self, voice_id: str) -> bool:
+        try:
+            self.index(voice_id)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, voice_id: str) -> Voice:
+        """Look up a voice. Token arrays are int64 copies of a few hundred bytes."""
+        index = self.index(voice_id)
+        prompt_text = self._string("prompt_texts", index)
+        return Voice(
+            voice_id=voice_id,
+            global_tokens=self._sections["global_tokens"][index].astype(np.int64),
+            semantic_tokens=self._ragged("semantic_tokens", index).astype(np.int64),
+            prompt_text=prompt_text or None,
+            metadata=json.loads(self._string("metadata", index)),
+        )
+
+
+# test
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    voices = [
+        Voice(
+            voice_id=f"speaker_{i:03d}",
+            global_tokens=rng.integers(0, 4096, 32),
+            semantic_tokens=rng.integers(0, 8192, rng.integers(0, 300)),
+            prompt_text=None if i % 3 == 0 else f"transcript {i}",
+            metadata={"index": i},
+        )
+        for i in range(100)
+    ]
+    path = write_voice_library(voices, Path(tempfile.mkdtemp()) / "voices.bin")
+    library = VoiceLibrary(path)
+    for voice in voices:
+        loaded = library[voice.voice_id]
+        assert np.array_equal(loaded.global_tokens, voice.global_tokens)
+        assert np.array_equal(loaded.semantic_tokens, voice.semantic_tokens)
+        assert loaded.prompt_text == voice.prompt_text
+        assert loaded.metadata == voice.metadata
+    assert "missing" not in library
+    print(len(library), os.path.getsize(path), "bytes")